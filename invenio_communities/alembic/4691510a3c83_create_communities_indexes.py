@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Create communities indexes."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '4691510a3c83'
+down_revision = 'd1e3e12b7082'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_communities_community_ranking_id', 'communities_community',
+     ['ranking', 'id'], True),
+    ('ix_communities_community_title_id', 'communities_community',
+     ['title', 'id'], True),
+    ('ix_communities_community_id_user_title', 'communities_community',
+     ['id_user', 'title'], False),
+    ('ix_communities_community_record_id_record',
+     'communities_community_record', ['id_record'], False),
+    ('ix_communities_community_record_expires_at',
+     'communities_community_record', ['expires_at'], False),
+    ('ix_communities_featured_community_start_date',
+     'communities_featured_community', ['start_date'], False),
+]
+"""Indexes as ``(name, table, columns, partial on non-deleted rows)``."""
+
+
+def upgrade():
+    """Upgrade database."""
+    if op.get_context().dialect.name == 'postgresql':
+        # Build the indexes without locking the tables against writes.
+        with op.get_context().autocommit_block():
+            for name, table, columns, partial in INDEXES:
+                op.create_index(
+                    name, table, columns, postgresql_concurrently=True,
+                    postgresql_where=sa.text('deleted_at IS NULL')
+                    if partial else None,
+                )
+    else:
+        for name, table, columns, partial in INDEXES:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    """Downgrade database."""
+    for name, table, columns, partial in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
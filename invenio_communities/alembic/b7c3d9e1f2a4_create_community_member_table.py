@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Create community member table."""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b7c3d9e1f2a4'
+down_revision = 'a5b0c6d2e4f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database.
+
+    The table is filled from the records with ``communities
+    rebuild-members``.
+    """
+    op.create_table(
+        'communities_community_member',
+        sa.Column('id_community', sa.String(length=100), nullable=False),
+        sa.Column('id_record', sqlalchemy_utils.types.uuid.UUIDType(),
+                  nullable=False),
+        sa.Column('accepted_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['id_community'], [u'communities_community.id'],
+            name='fk_communities_community_member_id_community',
+        ),
+        sa.ForeignKeyConstraint(
+            ['id_record'], [u'records_metadata.id'],
+            name='fk_communities_community_member_id_record',
+        ),
+        sa.PrimaryKeyConstraint('id_community', 'id_record')
+    )
+    op.create_index(
+        'ix_communities_community_member_id_record',
+        'communities_community_member', ['id_record'])
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index('ix_communities_community_member_id_record',
+                  table_name='communities_community_member')
+    op.drop_table('communities_community_member')
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Create communities full-text search index."""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd1e3e12b7082'
+down_revision = '2d9884d0e3fa'
+branch_labels = None
+depends_on = None
+
+INDEX = 'ix_communities_community_search'
+"""Name of the index."""
+
+
+def upgrade():
+    """Upgrade database."""
+    if op.get_context().dialect.name == 'postgresql':
+        # Build the index without locking the table against writes.
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY " + INDEX +
+                " ON communities_community USING gin "
+                "(to_tsvector('simple', "
+                "id || ' ' || title || ' ' || description))")
+
+
+def downgrade():
+    """Downgrade database."""
+    if op.get_context().dialect.name == 'postgresql':
+        op.drop_index(INDEX, table_name='communities_community')
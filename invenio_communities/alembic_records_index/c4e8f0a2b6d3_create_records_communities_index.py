@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Create records communities index.
+
+The index is only created on PostgreSQL, where the records metadata are
+stored as JSONB. It is an optional GIN index over the community ids of the
+records (see ``COMMUNITIES_RECORD_KEY``), which serves the containment
+queries of ``Community.record_ids_query()``.
+
+The recipe is on its own branch, outside of the default migrations, as it
+indexes the records table of Invenio-Records. Instances opt in by
+registering it in their ``setup.py``:
+
+.. code-block:: python
+
+    'invenio_db.alembic': [
+        'invenio_communities_records_index = '
+        'invenio_communities:alembic_records_index',
+    ],
+"""
+
+from alembic import op
+from flask import current_app
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8f0a2b6d3'
+down_revision = None
+branch_labels = (u'invenio_communities_records_index', )
+depends_on = 'b7c3d9e1f2a4'
+
+INDEX = 'ix_records_metadata_communities'
+"""Name of the index."""
+
+
+def upgrade():
+    """Upgrade database."""
+    if op.get_context().dialect.name == 'postgresql':
+        key = current_app.config['COMMUNITIES_RECORD_KEY']
+        # Build the index without locking the records against writes.
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {0} "
+                "ON records_metadata USING gin ((json -> '{1}') "
+                "jsonb_path_ops)".format(INDEX, key.replace("'", "''")))
+
+
+def downgrade():
+    """Downgrade database."""
+    if op.get_context().dialect.name == 'postgresql':
+        op.drop_index(INDEX, table_name='records_metadata')
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Probabilistic filter of the records with pending inclusion requests."""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import math
+import time
+import uuid
+from threading import Lock
+
+from invenio_db import db
+
+from .models import InclusionRequest
+
+
+class BloomFilter(object):
+    """Bloom filter of strings.
+
+    Membership tests never report false negatives, and report false positives
+    with a probability of about ``error_rate`` once ``capacity`` keys have
+    been added.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        """Initialize the filter.
+
+        :param capacity: Expected number of keys.
+        :param error_rate: Expected false positive probability.
+        """
+        capacity = max(capacity, 1)
+        self.size = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(
+            float(self.size) / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        """Compute the bit positions of a key with double hashing."""
+        digest = hashlib.md5(u'{0}'.format(key).encode('utf-8')).hexdigest()
+        h1, h2 = int(digest[:16], 16), int(digest[16:], 16)
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        """Add a key."""
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        """Test if a key was possibly added."""
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+
+class PendingRequestsFilter(object):
+    """Process-local filter of the records with pending inclusion requests.
+
+    The filter is rebuilt from the database when it is older than
+    ``max_age``, or when many of its records had their requests deleted.
+    Requests created in this process are added immediately. Requests created
+    by other processes are announced through a generation token in a shared
+    store, replaced after every commit creating requests: a record missing
+    from the filter is only reported as such once the token was checked, and
+    the filter is rebuilt first if the token changed. The token read is
+    reused by the misses of the next ``check_interval`` seconds.
+
+    The ``false_positives`` and ``negatives`` counters give the observed
+    false positive rate, used to tune the capacity of the filter.
+    """
+
+    generation_key = 'communities:pending-requests:generation'
+    """Store key of the generation token."""
+
+    def __init__(self, capacity=100000, error_rate=0.01, max_age=300,
+                 store=None, check_interval=1, timer=time.time):
+        """Initialize the filter.
+
+        :param capacity: Minimum capacity of the Bloom filter.
+        :param error_rate: Expected false positive probability.
+        :param max_age: Time in seconds after which the filter is rebuilt.
+        :param store: Key-value store shared by all the processes, with
+            ``get`` and ``set`` (``None`` for a single process).
+        :param check_interval: Time in seconds during which a read of the
+            generation token is reused.
+        :param timer: Function returning the current time in seconds.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_age = max_age
+        self.store = store
+        self.check_interval = check_interval
+        self.timer = timer
+        self.false_positives = 0
+        self.negatives = 0
+        self._filter = None
+        self._added = None
+        self._count = 0
+        self._deleted = 0
+        self._built_at = None
+        self._generation = None
+        self._checked_at = None
+        self._lock = Lock()
+
+    @property
+    def false_positive_rate(self):
+        """Return the observed false positive rate."""
+        total = self.false_positives + self.negatives
+        return float(self.false_positives) / total if total else 0.0
+
+    @property
+    def generation(self):
+        """Return the shared generation token (or ``None`` without store)."""
+        if self.store is None:
+            return None
+        generation = self.store.get(self.generation_key)
+        if generation is None:
+            generation = self.bump()
+        return generation
+
+    def bump(self):
+        """Announce new requests to the filters of all the processes.
+
+        It must be called once the requests are committed.
+        """
+        if self.store is None:
+            return None
+        generation = uuid.uuid4().hex
+        self.store.set(self.generation_key, generation, timeout=0)
+        return generation
+
+    def rebuild(self):
+        """Rebuild the filter from the pending inclusion requests."""
+        # The token is read before the requests, so that requests committed
+        # after this point are announced by a newer token.
+        generation = self.generation
+        with self._lock:
+            self._added = set()
+        record_ids = [
+            str(id_record) for id_record, in db.session.query(
+                InclusionRequest.id_record).distinct()
+        ]
+        bloom = BloomFilter(
+            max(self.capacity, 2 * len(record_ids)), self.error_rate)
+        for record_id in record_ids:
+            bloom.add(record_id)
+        with self._lock:
+            # Records added while the requests were being read.
+            for record_id in self._added:
+                bloom.add(record_id)
+            self._added = None
+            self._filter = bloom
+            self._count = len(record_ids)
+            self._deleted = 0
+            self._built_at = self.timer()
+            self._generation = generation
+            self._checked_at = self.timer()
+
+    def _current(self):
+        """Return the Bloom filter, rebuilding it if it is stale."""
+        if self._filter is None or \
+                self._built_at + self.max_age < self.timer() or \
+                self._deleted > max(self._count, 1000) // 2:
+            self.rebuild()
+        return self._filter
+
+    def add(self, record_id):
+        """Add a record whose inclusion request was created.
+
+        It does not query the database, as it is called during flushes: a
+        filter which was not built yet will read the request once built.
+        """
+        with self._lock:
+            if self._added is not None:
+                self._added.add(str(record_id))
+            if self._filter is not None:
+                self._filter.add(str(record_id))
+                self._count += 1
+
+    def discard(self, record_id):
+        """Account for a record whose inclusion request was deleted.
+
+        Keys cannot be removed from a Bloom filter, so the filter is rebuilt
+        once enough of its records are gone.
+        """
+        with self._lock:
+            self._deleted += 1
+
+    def _is_outdated(self):
+        """Check the shared generation token, at most once per interval."""
+        if self.store is None:
+            return False
+        now = self.timer()
+        if self._checked_at is not None and \
+                self._checked_at + self.check_interval > now:
+            return False
+        self._checked_at = now
+        return self.generation != self._generation
+
+    def __contains__(self, record_id):
+        """Test if a record possibly has pending inclusion requests."""
+        found = str(record_id) in self._current()
+        if not found and self._is_outdated():
+            self.rebuild()
+            found = str(record_id) in self._filter
+        if not found:
+            self.negatives += 1
+        return found
+
+    def record_false_positive(self):
+        """Count a record found in the filter without pending requests."""
+        self.false_positives += 1
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Caches for communities."""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, make_response, request, session
+from flask_babelex import get_locale
+from flask_login import current_user
+from invenio_db import db
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from .proxies import current_communities
+
+
+class CommunityCache(object):
+    """Process-local LRU cache of community rows.
+
+    The cache stores immutable snapshots of the column values, keyed by
+    community id. Entries are invalidated by the ``after_update`` and
+    ``after_delete`` mapper events of this process and expire after a given
+    time to bound the staleness of changes made by other processes.
+    """
+
+    def __init__(self, maxsize=1000, ttl=60, timer=time.time):
+        """Initialize the cache.
+
+        :param maxsize: Maximum number of entries (0 disables the cache).
+        :param ttl: Time in seconds after which an entry expires.
+        :param timer: Function returning the current time in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        """Return the number of cached entries."""
+        return len(self._entries)
+
+    def get(self, key):
+        """Get a snapshot, marking it as the most recently used entry.
+
+        :param key: Community id.
+        :returns: Snapshot of the community or ``None``.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < self.timer():
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, snapshot):
+        """Store a snapshot, evicting the least recently used entry.
+
+        :param key: Community id.
+        :param snapshot: Snapshot of the community.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self.timer() + self.ttl, snapshot)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Remove an entry from the cache.
+
+        :param key: Community id.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all the entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+
+def snapshot(obj):
+    """Create an immutable snapshot of the column values of a model object.
+
+    :param obj: Model object.
+    :returns: Tuple of ``(attribute, value)`` pairs.
+    """
+    return tuple(
+        (attr.key, getattr(obj, attr.key))
+        for attr in inspect(obj).mapper.column_attrs
+    )
+
+
+def restore(model, snapshot):
+    """Restore a model object from a snapshot, without querying the database.
+
+    The object is attached to the current session as a persistent object. If
+    the session already holds the object, that instance is returned instead.
+
+    :param model: Model class.
+    :param snapshot: Snapshot created by :func:`snapshot`.
+    :returns: Model object.
+    """
+    obj = model(**dict(snapshot))
+    make_transient_to_detached(obj)
+    existing = db.session.identity_map.get(inspect(obj).key)
+    if existing is not None:
+        return existing
+    return db.session.merge(obj, load=False)
+
+
+class InMemoryStore(object):
+    """Minimal in-memory key-value store.
+
+    It implements the subset of the ``werkzeug.contrib.cache`` (and
+    Flask-Caching) API used by :class:`ListingCache`, and stands in for a
+    shared cache such as Redis in tests and single-process deployments.
+    """
+
+    def __init__(self, default_timeout=300, timer=time.time):
+        """Initialize the store."""
+        self.default_timeout = default_timeout
+        self.timer = timer
+        self._entries = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        """Get a value or ``None`` if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or (entry[0] and entry[0] < self.timer()):
+            return None
+        return entry[1]
+
+    def set(self, key, value, timeout=None):
+        """Set a value (a timeout of 0 never expires)."""
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = self.timer() + timeout if timeout else 0
+        with self._lock:
+            self._entries[key] = (expires, value)
+        return True
+
+    def delete(self, key):
+        """Delete a value."""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+
+class ListingCache(object):
+    """Shared cache of rendered community listings.
+
+    Keys include a global generation token, stored in the same backend and
+    replaced after every committed write of a community, so that stale
+    listings are never served and old entries simply expire. A random token
+    is used rather than a counter, so that a backend losing the generation
+    key can never bring back an old generation.
+    """
+
+    generation_key = 'communities:generation'
+    """Backend key of the generation number."""
+
+    def __init__(self, store, timeout=300, prefix='communities:listing:'):
+        """Initialize the cache.
+
+        :param store: Key-value backend with ``get`` and ``set``.
+        :param timeout: Time in seconds after which an entry expires.
+        :param prefix: Prefix of the listing keys.
+        """
+        self.store = store
+        self.timeout = timeout
+        self.prefix = prefix
+
+    @property
+    def generation(self):
+        """Return the current generation token."""
+        generation = self.store.get(self.generation_key)
+        if generation is None:
+            generation = self.bump()
+        return generation
+
+    def bump(self):
+        """Start a new generation, invalidating all the entries."""
+        generation = uuid.uuid4().hex
+        self.store.set(self.generation_key, generation, timeout=0)
+        return generation
+
+    def make_key(self, *parts):
+        """Build the key of an entry for the current generation.
+
+        :param parts: Strings identifying the entry.
+        """
+        digest = hashlib.sha1(u'\x00'.join(
+            [u'{0}'.format(part) for part in parts]).encode('utf-8'))
+        return '{0}{1}:{2}'.format(
+            self.prefix, self.generation, digest.hexdigest())
+
+    def get(self, key):
+        """Get an entry."""
+        return self.store.get(key)
+
+    def set(self, key, value):
+        """Store an entry."""
+        self.store.set(key, value, timeout=self.timeout)
+
+
+def cached_listing(namespace, anonymous_only=False):
+    """Decorator to cache a listing view in the shared listing cache.
+
+    The whole response (body, status and headers) is cached for the request
+    URL, accepted MIME types and locale. Responses which are not successful
+    or which modify the session are never cached. Cached responses honor the
+    conditional request headers.
+
+    :param namespace: Name of the cached view.
+    :param anonymous_only: Only cache the view for anonymous users (for views
+        which render user-specific content).
+    """
+    def decorator(f):
+        @wraps(f)
+        def inner(*args, **kwargs):
+            cache = current_communities.listing_cache
+            if cache is None or (anonymous_only and (
+                    not current_user.is_anonymous or '_flashes' in session)):
+                return f(*args, **kwargs)
+
+            key = cache.make_key(namespace, request.url,
+                                 request.headers.get('Accept', ''),
+                                 get_locale())
+            cached = cache.get(key)
+            if cached is not None:
+                data, status, headers = cached
+                response = current_app.response_class(
+                    data, status=status, headers=headers)
+                return response.make_conditional(request)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not session.modified:
+                cache.set(key, (response.get_data(), response.status_code,
+                                list(response.headers)))
+            return response
+        return inner
+    return decorator
@@ -30,10 +30,10 @@ import click
 from flask.cli import with_appcontext
 from invenio_db import db
 from invenio_files_rest.errors import FilesException
-from invenio_indexer.api import RecordIndexer
 from invenio_records.api import Record
 
-from .models import Community, InclusionRequest
+from .indexer import index_after_commit
+from .models import Community, CommunityMember, InclusionRequest
 from .utils import initialize_communities_bucket, save_and_validate_logo
 
 
@@ -89,8 +89,8 @@ def request(community_id, record_id, accept):
     else:
         InclusionRequest.create(community=c, record=record,
                                 notify=False)
+    index_after_commit([record.id], partial=True)
     db.session.commit()
-    RecordIndexer().index_by_id(record.id)
 
 
 @communities.command()
@@ -101,6 +101,19 @@ def remove(community_id, record_id):
     """Remove a record from community."""
     c = Community.get(community_id)
     assert c is not None
-    c.remove_record(record_id)
+    record = Record.get_record(record_id)
+    c.remove_record(record)
+    record.commit()
+    index_after_commit([record.id], partial=True)
     db.session.commit()
-    RecordIndexer().index_by_id(record_id)
+
+
+@communities.command('rebuild-members')
+@click.option('--chunk-size', default=1000, type=int,
+              help='Number of records processed per transaction.')
+@with_appcontext
+def rebuild_members(chunk_size):
+    """Rebuild the community membership table from the records."""
+    inserted, deleted = CommunityMember.rebuild(chunk_size=chunk_size)
+    click.secho('{0} memberships added, {1} removed.'.format(
+        inserted, deleted), fg='green')
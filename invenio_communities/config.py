@@ -35,6 +35,94 @@ COMMUNITIES_REQUEST_EXPIRY_TIME = timedelta(days=365)
 COMMUNITIES_DELETE_HOLDOUT_TIME = timedelta(days=365)
 """Time after which the communities marked for deletion are hard-deleted."""
 
+COMMUNITIES_DELETE_RECORD_IDS = \
+    'invenio_communities.purge:search_record_ids'
+"""Function streaming the ids of the records of a community to delete.
+
+Use ``invenio_communities.purge:member_record_ids`` to read them from the
+community membership table instead of the search engine.
+"""
+
+COMMUNITIES_EXPORT_CHUNK_SIZE = 1000
+"""Number of communities fetched at a time by the NDJSON export."""
+
+COMMUNITIES_INDEXING_BULK = True
+"""Send the records whose communities changed to the bulk indexing queue.
+
+The records are sent once the transaction is committed. Disable it to index
+the records synchronously instead (e.g. in tests).
+"""
+
+COMMUNITIES_INDEXING_PARTIAL = False
+"""Update the community fields of indexed records in place.
+
+When only the communities of a record changed (e.g. after a curation action),
+its indexed document is fetched and written back with the new community
+fields by a Celery task, instead of serializing and indexing the whole
+record. Only enable it
+if the community fields are indexed as is (``COMMUNITIES_RECORD_KEY``,
+``provisional_communities`` and ``_oai``).
+"""
+
+COMMUNITIES_INDEXING_PREFETCH_SIZE = 500
+"""Number of bulk indexing messages whose provisional communities are fetched
+together by :class:`invenio_communities.indexer.CommunitiesRecordIndexer`.
+
+The records sent for indexing (see ``COMMUNITIES_INDEXING_BULK``) go to the
+bulk indexing queue of Invenio-Indexer, which only prefetches them, and
+coalesces repeated messages of a record, when it is consumed by the
+``invenio_communities.tasks.process_bulk_queue`` task. Schedule it instead
+of ``invenio_indexer.tasks.process_bulk_queue`` with Celery beat:
+
+.. code-block:: python
+
+    CELERYBEAT_SCHEDULE = {
+        'indexer': {
+            'task': 'invenio_communities.tasks.process_bulk_queue',
+            'schedule': timedelta(minutes=5),
+        },
+    }
+"""
+
+COMMUNITIES_PENDING_REQUESTS_FILTER = False
+"""Skip the inclusion request lookup of records known to have none.
+
+A process-local Bloom filter of the records with pending inclusion requests
+is consulted before indexing a record. It is only enabled together with
+``COMMUNITIES_PENDING_REQUESTS_FILTER_STORE``, through which the processes
+creating requests invalidate the filters of the other processes.
+"""
+
+COMMUNITIES_PENDING_REQUESTS_FILTER_CAPACITY = 100000
+"""Minimum number of records of the pending requests filter."""
+
+COMMUNITIES_PENDING_REQUESTS_FILTER_ERROR_RATE = 0.01
+"""Expected false positive rate of the pending requests filter."""
+
+COMMUNITIES_PENDING_REQUESTS_FILTER_MAX_AGE = 300
+"""Time in seconds after which the pending requests filter is rebuilt."""
+
+COMMUNITIES_PENDING_REQUESTS_FILTER_CHECK_INTERVAL = 1
+"""Time in seconds during which the pending requests filter reuses a read of
+the shared generation token (see ``COMMUNITIES_PENDING_REQUESTS_FILTER``).
+
+Requests committed by other processes during the interval may be missed by
+the records indexed in the meantime without prefetching (see
+``COMMUNITIES_INDEXING_PREFETCH_SIZE``).
+"""
+
+COMMUNITIES_PENDING_REQUESTS_FILTER_STORE = None
+"""Factory of the shared store of the pending requests filter generation.
+
+Import path or callable returning a key-value store with the
+``werkzeug.contrib.cache`` API (``get`` and ``set``), for instance a Redis
+cache shared by all the workers, or
+``'invenio_communities.cache:InMemoryStore'`` for a single process.
+"""
+
+COMMUNITIES_MULTIGET_MAX_IDS = 100
+"""Maximum number of communities fetched at once by id."""
+
 COMMUNITIES_LOGO_EXTENSIONS = ['png', 'jpg', 'jpeg', 'svg']
 """Allowed file extensions for the communities logo."""
 
@@ -53,6 +141,70 @@ COMMUNITIES_SORTING_OPTIONS = [
 COMMUNITIES_DEFAULT_SORTING_OPTION = 'ranking'
 """Default sorting option."""
 
+COMMUNITIES_RANKING_SCORE = \
+    'invenio_communities.ranking:default_ranking_score'
+"""Function computing the ranking score of a community.
+
+It receives the number of accepted records, the time of the last accepted
+record, the fixed points of the community and the current time.
+"""
+
+COMMUNITIES_RANKING_RECORD_COUNTS = \
+    'invenio_communities.ranking:search_record_counts'
+"""Function returning the number of accepted records by community id.
+
+The ranking is recomputed by the ``invenio_communities.tasks.update_ranking``
+task, which can be scheduled with Celery beat:
+
+.. code-block:: python
+
+    CELERYBEAT_SCHEDULE = {
+        'communities-ranking': {
+            'task': 'invenio_communities.tasks.update_ranking',
+            'schedule': timedelta(hours=1),
+        },
+    }
+
+Use ``invenio_communities.ranking:member_record_counts`` to count the records
+in the community membership table instead of the search engine.
+"""
+
+COMMUNITIES_SEARCH_BACKEND = \
+    'invenio_communities.search:LikeSearchBackend'
+"""Backend used to filter communities by a search pattern.
+
+Use ``invenio_communities.search:PostgreSQLSearchBackend`` on PostgreSQL to
+query the GIN-indexed full-text representation of the communities, ordered by
+relevance when no sorting option is given.
+"""
+
+COMMUNITIES_CACHE_SIZE = 1000
+"""Maximum number of communities kept in the process-local cache.
+
+Set to 0 to disable the cache used by
+:meth:`invenio_communities.models.Community.get`.
+"""
+
+COMMUNITIES_CACHE_TTL = 60
+"""Time in seconds after which a cached community is reloaded.
+
+Changes made in the same process invalidate the cache immediately, this
+bounds the staleness of changes made by other processes.
+"""
+
+COMMUNITIES_LISTING_CACHE = None
+"""Factory of the shared cache for rendered community listings.
+
+Import path or callable returning a key-value store with the
+``werkzeug.contrib.cache`` API (``get`` and ``set``), for instance a Redis
+cache shared by all the workers. The index page (for anonymous users) and
+the REST list are cached when set, e.g.
+``'invenio_communities.cache:InMemoryStore'`` for a single process.
+"""
+
+COMMUNITIES_LISTING_CACHE_TIMEOUT = 300
+"""Time in seconds after which a cached community listing expires."""
+
 COMMUNITIES_OAI_FORMAT = 'user-{community_id}'
 """String template for the community OAISet 'spec'."""
 
@@ -26,17 +26,26 @@
 
 from __future__ import absolute_import, print_function
 
+from flask import current_app
+from invenio_db import db
 from invenio_indexer.signals import before_record_index
 from sqlalchemy.event import listen
 from werkzeug.utils import cached_property
 
 from . import config
+from .bloom import PendingRequestsFilter
+from .cache import CommunityCache, ListingCache
 from .cli import communities as cmd
-from .models import Community
+from .indexer import collect_committed_records, index_committed_records
+from .models import Community, FeaturedCommunity, InclusionRequest
 from .permissions import permission_factory
-from .receivers import create_oaipmh_set, destroy_oaipmh_set, \
-    inject_provisional_community, new_request
+from .receivers import add_pending_request, announce_pending_requests, \
+    bump_listing_generation, clear_community_cache, clear_listing_changes, \
+    clear_pending_requests, create_oaipmh_set, destroy_oaipmh_set, \
+    discard_pending_request, inject_provisional_community, \
+    invalidate_community_cache, mark_listing_changed, new_request
 from .signals import inclusion_request_created
+from .utils import obj_or_import_string
 
 
 class InvenioCommunities(object):
@@ -63,6 +72,20 @@ class InvenioCommunities(object):
             listen(Community, 'after_insert', create_oaipmh_set)
             listen(Community, 'after_delete', destroy_oaipmh_set)
         inclusion_request_created.connect(new_request)
+        listen(InclusionRequest, 'after_insert', add_pending_request)
+        listen(InclusionRequest, 'after_delete', discard_pending_request)
+        listen(Community, 'after_update', invalidate_community_cache)
+        listen(Community, 'after_delete', invalidate_community_cache)
+        listen(db.session, 'after_rollback', clear_community_cache)
+        for model in (Community, FeaturedCommunity):
+            for event in ('after_insert', 'after_update', 'after_delete'):
+                listen(model, event, mark_listing_changed)
+        listen(db.session, 'after_commit', bump_listing_generation)
+        listen(db.session, 'after_transaction_end', clear_listing_changes)
+        listen(db.session, 'after_commit', announce_pending_requests)
+        listen(db.session, 'after_transaction_end', clear_pending_requests)
+        listen(db.session, 'after_commit', collect_committed_records)
+        listen(db.session, 'after_transaction_end', index_committed_records)
 
     def init_config(self, app):
         """Initialize configuration."""
@@ -80,3 +103,52 @@ class InvenioCommunities(object):
     def permission_factory(self):
         """Load default permission factory."""
         return permission_factory
+
+    @cached_property
+    def community_cache(self):
+        """Process-local cache of communities."""
+        return CommunityCache(
+            maxsize=current_app.config['COMMUNITIES_CACHE_SIZE'],
+            ttl=current_app.config['COMMUNITIES_CACHE_TTL'],
+        )
+
+    @cached_property
+    def listing_cache(self):
+        """Shared cache of rendered community listings (or ``None``)."""
+        store = obj_or_import_string(
+            current_app.config['COMMUNITIES_LISTING_CACHE'])
+        if not store:
+            return None
+        return ListingCache(
+            store(),
+            timeout=current_app.config['COMMUNITIES_LISTING_CACHE_TIMEOUT'],
+        )
+
+    @cached_property
+    def pending_requests(self):
+        """Filter of the records with pending inclusion requests (or None).
+
+        It requires a store shared by all the processes.
+        """
+        store = obj_or_import_string(
+            current_app.config['COMMUNITIES_PENDING_REQUESTS_FILTER_STORE'])
+        if not current_app.config['COMMUNITIES_PENDING_REQUESTS_FILTER'] or \
+                not store:
+            return None
+        return PendingRequestsFilter(
+            capacity=current_app.config[
+                'COMMUNITIES_PENDING_REQUESTS_FILTER_CAPACITY'],
+            error_rate=current_app.config[
+                'COMMUNITIES_PENDING_REQUESTS_FILTER_ERROR_RATE'],
+            max_age=current_app.config[
+                'COMMUNITIES_PENDING_REQUESTS_FILTER_MAX_AGE'],
+            store=store(),
+            check_interval=current_app.config[
+                'COMMUNITIES_PENDING_REQUESTS_FILTER_CHECK_INTERVAL'],
+        )
+
+    @cached_property
+    def search_backend(self):
+        """Load the search backend used to filter communities."""
+        return obj_or_import_string(
+            current_app.config['COMMUNITIES_SEARCH_BACKEND'])()
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Deferred indexing of the records whose communities changed."""
+
+from __future__ import absolute_import, print_function
+
+from contextlib import contextmanager
+from itertools import islice
+from threading import local
+
+from flask import current_app
+from invenio_db import db
+from invenio_indexer.api import RecordIndexer
+from invenio_records.api import Record
+
+from .models import InclusionRequest
+
+_prefetched = local()
+
+
+def fetch_provisional_communities(record_ids):
+    """Fetch the pending inclusion requests of many records in one query.
+
+    :param record_ids: Ids of the records.
+    :returns: Dictionary of sorted community id lists by record id.
+    """
+    lookup = dict((str(i), []) for i in record_ids)
+    if lookup:
+        rows = db.session.query(
+            InclusionRequest.id_record, InclusionRequest.id_community
+        ).filter(InclusionRequest.id_record.in_(list(lookup)))
+        for id_record, id_community in rows:
+            lookup[str(id_record)].append(id_community)
+        for communities in lookup.values():
+            communities.sort()
+    return lookup
+
+
+@contextmanager
+def prefetch_provisional_communities(record_ids):
+    """Prefetch the provisional communities of records about to be indexed.
+
+    While the context is active, the ``inject_provisional_community``
+    receiver reads the provisional communities of these records from the
+    prefetched lookup instead of querying them one record at a time.
+
+    :param record_ids: Ids of the records.
+    """
+    previous = getattr(_prefetched, 'lookup', None)
+    _prefetched.lookup = fetch_provisional_communities(record_ids)
+    try:
+        yield _prefetched.lookup
+    finally:
+        _prefetched.lookup = previous
+
+
+def get_prefetched_provisional_communities(record_id):
+    """Get the prefetched provisional communities of a record.
+
+    :param record_id: Id of the record.
+    :returns: List of community ids, or ``None`` if they were not prefetched.
+    """
+    lookup = getattr(_prefetched, 'lookup', None)
+    if lookup is not None:
+        return lookup.get(str(record_id))
+
+
+def coalesce_messages(messages):
+    """Keep the last bulk indexing message of each record.
+
+    The records are read when their message is processed, so that earlier
+    messages of the same record are redundant. They are acknowledged and
+    dropped.
+
+    :param messages: Queue messages.
+    :returns: List of the remaining messages, in their original order.
+    """
+    last = dict((m.decode()['id'], i) for i, m in enumerate(messages))
+    kept = []
+    for i, message in enumerate(messages):
+        if last[message.decode()['id']] == i:
+            kept.append(message)
+        else:
+            message.ack()
+    return kept
+
+
+class CommunitiesRecordIndexer(RecordIndexer):
+    """Record indexer prefetching the provisional communities.
+
+    The messages of the bulk queue are processed in chunks (see
+    ``COMMUNITIES_INDEXING_PREFETCH_SIZE``). Repeated messages of a record
+    within a chunk are coalesced, and the provisional communities of each
+    chunk are fetched in one query.
+    """
+
+    def _actionsiter(self, message_iterator):
+        """Iterate bulk actions, prefetching each chunk of messages."""
+        size = current_app.config['COMMUNITIES_INDEXING_PREFETCH_SIZE']
+        message_iterator = iter(message_iterator)
+        while True:
+            chunk = list(islice(message_iterator, size))
+            if not chunk:
+                return
+            chunk = coalesce_messages(chunk)
+            record_ids = [
+                payload['id'] for payload in (m.decode() for m in chunk)
+                if payload.get('op') != 'delete'
+            ]
+            with prefetch_provisional_communities(record_ids):
+                for action in super(CommunitiesRecordIndexer,
+                                    self)._actionsiter(chunk):
+                    yield action
+
+
+def index_after_commit(record_ids, partial=False):
+    """Index records once the current transaction is committed.
+
+    The ids are collected in the session and sent together when the
+    outermost transaction is committed. They are dropped if it is rolled
+    back.
+
+    :param record_ids: Ids of the records to index.
+    :param partial: Only the community fields of the records changed, so
+        that their indexed documents can be updated in place (see
+        ``COMMUNITIES_INDEXING_PARTIAL``).
+    """
+    key = 'communities_index_partial' if partial else 'communities_index'
+    db.session.info.setdefault(key, set()).update(str(i) for i in record_ids)
+
+
+def index_records(record_ids):
+    """Index records.
+
+    The records are sent to the bulk indexing queue, or indexed
+    synchronously if ``COMMUNITIES_INDEXING_BULK`` is disabled.
+
+    :param record_ids: Ids of the records to index.
+    """
+    record_ids = sorted(record_ids)
+    if not record_ids:
+        return
+    indexer = RecordIndexer()
+    if current_app.config['COMMUNITIES_INDEXING_BULK']:
+        indexer.bulk_index(record_ids)
+    else:
+        with prefetch_provisional_communities(record_ids):
+            for record_id in record_ids:
+                indexer.index_by_id(record_id)
+
+
+def community_fields(record, index, provisional_communities):
+    """Build the indexed fields which depend on the communities of a record.
+
+    :param record: Record object.
+    :param index: Index of the record.
+    :param provisional_communities: Sorted ids of the communities with a
+        pending inclusion request for the record.
+    :returns: Dictionary of the fields.
+    """
+    key = current_app.config['COMMUNITIES_RECORD_KEY']
+    fields = {key: record.get(key, [])}
+    if index.startswith(current_app.config['COMMUNITIES_INDEX_PREFIX']):
+        fields['provisional_communities'] = provisional_communities
+    if current_app.config['COMMUNITIES_OAI_ENABLED'] and '_oai' in record:
+        fields['_oai'] = record['_oai']
+    if record.updated:
+        fields['_updated'] = record.updated.isoformat()
+    return fields
+
+
+def update_records(record_ids, client=None):
+    """Update the community fields of indexed records in place.
+
+    The indexed documents are fetched with one multi-get request, their
+    community fields are replaced, and they are written back with one bulk
+    request under the current revision of the records. This avoids
+    serializing the whole records and running the indexing receivers, while
+    keeping the external versioning of the documents (which the update API
+    of the search engine does not support).
+
+    :param record_ids: Ids of the records.
+    :param client: Search engine client (defaults to the current one).
+    :returns: Ids of the records which need a full reindex (e.g. because
+        their document is missing).
+    """
+    if client is None:
+        from invenio_search import current_search_client as client
+
+    records = Record.get_records(list(record_ids))
+    if not records:
+        return set()
+    indexer = RecordIndexer()
+    provisional = fetch_provisional_communities(r.id for r in records)
+    targets = [(record, indexer.record_to_index(record)) for record in records]
+
+    found = client.mget(body={'docs': [
+        {'_index': index, '_type': doc_type, '_id': str(record.id)}
+        for record, (index, doc_type) in targets
+    ]})['docs']
+
+    missing, body = set(), []
+    for (record, (index, doc_type)), doc in zip(targets, found):
+        if not doc.get('found'):
+            missing.add(str(record.id))
+            continue
+        source = doc['_source']
+        source.update(community_fields(
+            record, index, provisional[str(record.id)]))
+        body.append({'index': {
+            '_index': index, '_type': doc_type, '_id': str(record.id),
+            'version': record.revision_id, 'version_type': 'external_gte',
+        }})
+        body.append(source)
+
+    if body:
+        result = client.bulk(body=body)
+        if result.get('errors'):
+            for item in result['items']:
+                item = item['index']
+                # A conflict means that a newer revision is already indexed.
+                if item.get('error') and item.get('status') != 409:
+                    missing.add(item['_id'])
+    return missing
+
+
+def collect_committed_records(session):
+    """Signal for marking the collected records as committed.
+
+    The signal is also sent when a savepoint is released, in which case the
+    records are kept pending until the outermost transaction is committed.
+    """
+    if session.transaction.nested:
+        return
+    for key in ('communities_index', 'communities_index_partial'):
+        pending = session.info.pop(key, None)
+        if pending:
+            session.info.setdefault(
+                key + '_committed', set()).update(pending)
+
+
+def index_committed_records(session, transaction):
+    """Signal for indexing the committed records when a transaction ends.
+
+    Only the end of the outermost transaction is considered, as the records
+    are only visible to the indexer once it is committed.
+    """
+    if transaction.parent is not None:
+        return
+    session.info.pop('communities_index', None)
+    session.info.pop('communities_index_partial', None)
+    committed = session.info.pop('communities_index_committed', None) or set()
+    partial = session.info.pop(
+        'communities_index_partial_committed', None) or set()
+    partial -= committed
+    if partial:
+        if current_app.config['COMMUNITIES_INDEXING_PARTIAL']:
+            from .tasks import update_indexed_records
+            update_indexed_records.delay(sorted(partial))
+        else:
+            committed |= partial
+    if committed:
+        index_records(committed)
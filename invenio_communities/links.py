@@ -26,22 +26,66 @@
 
 from __future__ import absolute_import, print_function
 
-from flask import current_app, request, url_for
+from flask import current_app, has_request_context, request, url_for
+from werkzeug.urls import url_quote
+
+from .utils import KeysetPagination, logo_path
+
+ID_PLACEHOLDER = '__community_id__'
+"""Placeholder of the community id in the URL templates."""
+
+
+def url_template(key, build):
+    """Get a URL template, built once per request.
+
+    :param key: Key of the template in the request.
+    :param build: Function building the URL for a given community id.
+    :returns: Tuple of the URL parts before and after the community id.
+    """
+    if not has_request_context():
+        return tuple(build(ID_PLACEHOLDER).split(ID_PLACEHOLDER, 1))
+    templates = getattr(request, '_communities_url_templates', None)
+    if templates is None:
+        templates = request._communities_url_templates = {}
+    if key not in templates:
+        templates[key] = tuple(build(ID_PLACEHOLDER).split(ID_PLACEHOLDER, 1))
+    return templates[key]
+
+
+def community_logo_url(community_id, logo_ext):
+    """Build the absolute URL of a community logo.
+
+    :param community_id: Id of the community.
+    :param logo_ext: Extension of the logo, or ``None`` if there is none.
+    :returns: URL of the logo (see ``Community.logo_url``) or ``None``.
+    """
+    if not logo_ext:
+        return None
+    prefix, suffix = url_template(
+        ('logo', logo_ext), lambda community_id: u'{0}{1}'.format(
+            current_app.config.get('THEME_SITEURL'),
+            logo_path(community_id, logo_ext)))
+    return u'{0}{1}{2}'.format(prefix, community_id, suffix)
 
 
 def default_links_item_factory(community):
     """Factory for record links generation."""
-    return dict(
-        self=url_for(
-            '.communities_item', community_id=community['id'], _external=True),
-        html=current_app.config.get(
+    self_prefix, self_suffix = url_template(
+        ('self', request.blueprint), lambda community_id: url_for(
+            '.communities_item', community_id=community_id, _external=True))
+    html_prefix, html_suffix = url_template(
+        'html', lambda community_id: current_app.config.get(
             'COMMUNITIES_URL_COMMUNITY_VIEW',
             '{protocol}://{host}/communities/{community_id}/'
         ).format(
             protocol=request.environ['wsgi.url_scheme'],
             host=request.environ['HTTP_HOST'],
-            community_id=community['id']
-        )
+            community_id=community_id
+        ))
+    community_id = url_quote(community['id'], safe='/:')
+    return dict(
+        self=self_prefix + community_id + self_suffix,
+        html=html_prefix + community_id + html_suffix,
     )
 
 
@@ -49,6 +93,16 @@ def default_links_pagination_factory(page, urlkwargs):
     """Factory for record links generation."""
     endpoint = '.communities_list'
 
+    if isinstance(page, KeysetPagination):
+        links = {
+            'self': url_for(endpoint, cursor=page.cursor or '',
+                            _external=True, **urlkwargs),
+        }
+        if page.has_next:
+            links['next'] = url_for(endpoint, cursor=page.next_cursor,
+                                    _external=True, **urlkwargs)
+        return links
+
     links = {
         'self': url_for(endpoint, page=page.page, _external=True, **urlkwargs),
     }
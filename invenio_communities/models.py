@@ -26,7 +26,6 @@
 
 from __future__ import absolute_import, print_function
 
-import hashlib
 from datetime import datetime
 
 from flask import current_app, url_for
@@ -34,16 +33,23 @@ from invenio_accounts.models import User
 from invenio_db import db
 from invenio_records.api import Record
 from invenio_records.models import RecordMetadata
+from sqlalchemy import inspect
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.event import listen
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session
 from sqlalchemy.orm.exc import FlushError
 from sqlalchemy_utils.models import Timestamp
 from sqlalchemy_utils.types import UUIDType
 
+from .cache import restore, snapshot
 from .errors import CommunitiesError, InclusionRequestExistsError, \
     InclusionRequestExpiryTimeError, InclusionRequestMissingError, \
     InclusionRequestObsoleteError
+from .proxies import current_communities
+from .search import create_search_index, drop_search_index
 from .signals import inclusion_request_created
-from .utils import save_and_validate_logo
+from .utils import logo_path, save_and_validate_logo
 
 
 class InclusionRequest(db.Model, Timestamp):
@@ -68,7 +74,8 @@ class InclusionRequest(db.Model, Timestamp):
     id_record = db.Column(
         UUIDType,
         db.ForeignKey(RecordMetadata.id),
-        primary_key=True
+        primary_key=True,
+        index=True,
     )
     """Id of the record applying to given community."""
 
@@ -84,6 +91,7 @@ class InclusionRequest(db.Model, Timestamp):
         db.DateTime,
         nullable=True,
         default=None,
+        index=True,
     )
     """Expiry date of the record request."""
 
@@ -163,12 +171,62 @@ class InclusionRequest(db.Model, Timestamp):
         """Get inclusion requests for a given record."""
         return cls.query.filter_by(id_record=record_uuid)
 
+    @classmethod
+    def delete_expired(cls, now=None, limit=1000):
+        """Delete a chunk of expired inclusion requests.
+
+        The oldest expired requests are selected through the ``expires_at``
+        index. On PostgreSQL they are deleted with a single
+        ``DELETE ... RETURNING`` statement, skipping the rows locked by
+        concurrent transactions.
+
+        :param now: Expiry reference time (defaults to now).
+        :param limit: Maximum number of requests to delete.
+        :returns: Ids of the records of the deleted requests.
+        """
+        now = now or datetime.utcnow()
+        table = cls.__table__
+        expired = db.select([table.c.id_community, table.c.id_record]).where(
+            table.c.expires_at < now
+        ).order_by(table.c.expires_at).limit(limit)
+
+        if db.session.bind.dialect.name == 'postgresql':
+            key = db.tuple_(table.c.id_community, table.c.id_record)
+            return [row.id_record for row in db.session.execute(
+                table.delete().where(key.in_(
+                    expired.with_for_update(skip_locked=True)
+                )).returning(table.c.id_record)
+            )]
+
+        rows = db.session.execute(expired).fetchall()
+        by_community = {}
+        for id_community, id_record in rows:
+            by_community.setdefault(id_community, []).append(id_record)
+        for id_community, record_ids in by_community.items():
+            db.session.execute(table.delete().where(db.and_(
+                table.c.id_community == id_community,
+                table.c.id_record.in_(record_ids),
+            )))
+        return [id_record for id_community, id_record in rows]
+
 
 class Community(db.Model, Timestamp):
     """Represent a community."""
 
     __tablename__ = 'communities_community'
 
+    __table_args__ = (
+        db.Index(
+            'ix_communities_community_ranking_id', 'ranking', 'id',
+            postgresql_where=db.text('deleted_at IS NULL'),
+        ),
+        db.Index(
+            'ix_communities_community_title_id', 'title', 'id',
+            postgresql_where=db.text('deleted_at IS NULL'),
+        ),
+        db.Index('ix_communities_community_id_user_title', 'id_user', 'title'),
+    )
+
     id = db.Column(db.String(100), primary_key=True)
     """Id of the community."""
 
@@ -199,7 +257,7 @@ class Community(db.Model, Timestamp):
     """Extension of the logo."""
 
     ranking = db.Column(db.Integer, nullable=False, default=0)
-    """Ranking of community. Updated by ranking deamon."""
+    """Ranking of community. Updated by the ranking task."""
 
     fixed_points = db.Column(db.Integer, nullable=False, default=0)
     """Points which will be always added to overall score of community."""
@@ -207,6 +265,18 @@ class Community(db.Model, Timestamp):
     deleted_at = db.Column(db.DateTime, nullable=True, default=None)
     """Time at which the community was soft-deleted."""
 
+    version_id = db.Column(db.Integer, nullable=False)
+    """Version of the community, incremented on every update.
+
+    It is used as cache validator and for optimistic concurrency control:
+    updating a community which was modified in the meantime raises
+    ``sqlalchemy.orm.exc.StaleDataError``.
+    """
+
+    __mapper_args__ = {
+        'version_id_col': version_id,
+    }
+
     #
     # Relationships
     #
@@ -235,12 +305,35 @@ class Community(db.Model, Timestamp):
         return False
 
     @classmethod
-    def get(cls, community_id, with_deleted=False):
-        """Get a community."""
-        q = cls.query.filter_by(id=community_id)
-        if not with_deleted:
-            q = q.filter(cls.deleted_at.is_(None))
-        return q.one_or_none()
+    def get(cls, community_id, with_deleted=False, cached=False):
+        """Get a community.
+
+        :param community_id: Id of the community.
+        :param with_deleted: Also return a community marked for deletion.
+        :param cached: Read the row through the process-local community
+            cache (see ``COMMUNITIES_CACHE_SIZE``). A cached row may be
+            outdated, with a stale version failing any update, so that it is
+            only meant for read-only uses.
+        """
+        cache = current_communities.community_cache
+        values = cache.get(community_id) if cached else None
+        if values is not None:
+            obj = restore(cls, values)
+        else:
+            existing = db.session.identity_map.get(
+                inspect(cls).identity_key_from_primary_key([community_id]))
+            if existing is not None and db.session.is_modified(existing):
+                obj = existing
+            else:
+                # Refresh an instance restored from the cache.
+                obj = cls.query.filter_by(
+                    id=community_id).populate_existing().one_or_none()
+                if obj is None:
+                    return None
+                cache.set(community_id, snapshot(obj))
+        if not with_deleted and obj.is_deleted:
+            return None
+        return obj
 
     @classmethod
     def get_by_user(cls, user_id, with_deleted=False):
@@ -251,57 +344,118 @@ class Community(db.Model, Timestamp):
         if not with_deleted:
             query = query.filter(cls.deleted_at.is_(None))
 
-        return query.order_by(db.asc(Community.title))
+        return query.options(*cls.listing_options()).order_by(
+            db.asc(Community.title))
+
+    @classmethod
+    def listing_options(cls):
+        """Return the query options of the community listings.
+
+        They defer the columns which are only displayed on the community
+        pages.
+        """
+        return [db.defer(cls.page), db.defer(cls.curation_policy)]
 
     @classmethod
     def filter_communities(cls, p, so, with_deleted=False):
         """Search for communities.
 
         Helper function which takes from database only those communities which
-        match search criteria. Uses parameter 'so' to set communities in the
-        correct order.
+        match search criteria. The matching is delegated to the configured
+        search backend (see ``COMMUNITIES_SEARCH_BACKEND``). Uses parameter
+        'so' to set communities in the correct order; if it is not a valid
+        sorting option and the backend ranks results, they are ordered by
+        relevance.
 
         Parameter 'page' is introduced to restrict results and return only
         slice of them for the current page. If page == 0 function will return
         all communities that match the pattern.
+
+        The long ``page`` and ``curation_policy`` columns, which listings do
+        not display, are only loaded when accessed.
         """
         query = cls.query if with_deleted else \
             cls.query.filter(cls.deleted_at.is_(None))
+        query = query.options(*cls.listing_options())
 
+        relevance = None
         if p:
-            p = p.replace(' ', '%')
-            query = query.filter(db.or_(
-                cls.id.ilike('%' + p + '%'),
-                cls.title.ilike('%' + p + '%'),
-                cls.description.ilike('%' + p + '%'),
-            ))
+            query, relevance = current_communities.search_backend.search(
+                query, cls, p)
 
         if so in current_app.config['COMMUNITIES_SORTING_OPTIONS']:
             order = so == 'title' and db.asc or db.desc
             query = query.order_by(order(getattr(cls, so)))
+        elif relevance is not None:
+            query = query.order_by(relevance)
         else:
             query = query.order_by(db.desc(cls.ranking))
         return query
 
+    @classmethod
+    def get_collection_version(cls):
+        """Return a cheap validator of the whole communities table.
+
+        The sum of the versions changes with every update, and the number of
+        rows with every insertion or deletion.
+
+        :returns: Tuple of the last update time, the number of rows and the
+            sum of their versions.
+        """
+        return db.session.query(
+            db.func.max(cls.updated), db.func.count(cls.id),
+            db.func.coalesce(db.func.sum(cls.version_id), 0)).one()
+
+    @classmethod
+    def keyset_columns(cls, so):
+        """Return the keyset pagination columns for a sorting option.
+
+        The community id is used as a tiebreaker.
+
+        :param so: Sorting option ('title' or 'ranking').
+        :returns: Tuple of the keyset columns and whether they are sorted
+            in descending order.
+        """
+        if so == 'title':
+            return (cls.title, cls.id), False
+        return (cls.ranking, cls.id), True
+
     def add_record(self, record):
         """Add a record to the community.
 
         :param record: Record object.
         :type record: `invenio_records.api.Record`
         """
-        key = current_app.config['COMMUNITIES_RECORD_KEY']
-        record.setdefault(key, [])
+        self.add_records([record])
 
-        if self.has_record(record):
-            current_app.logger.warning(
-                'Community addition: record {uuid} is already in community '
-                '"{comm}"'.format(uuid=record.id, comm=self.id))
-        else:
-            record[key].append(self.id)
-            record[key] = sorted(record[key])
-        if current_app.config['COMMUNITIES_OAI_ENABLED']:
-            if not self.oaiset.has_record(record):
-                self.oaiset.add_record(record)
+    def add_records(self, records):
+        """Add many records to the community.
+
+        The OAISet of the community is resolved once for all the records, and
+        the membership rows are inserted together (see
+        :class:`CommunityMember`).
+
+        :param records: Iterable of record objects.
+        :type records: iterable of `invenio_records.api.Record`
+        """
+        key = current_app.config['COMMUNITIES_RECORD_KEY']
+        oaiset = self.oaiset if current_app.config['COMMUNITIES_OAI_ENABLED'] \
+            else None
+
+        records = list(records)
+        for record in records:
+            communities = record.setdefault(key, [])
+            if self.id in communities:
+                current_app.logger.warning(
+                    'Community addition: record {uuid} is already in '
+                    'community "{comm}"'.format(uuid=record.id, comm=self.id))
+            else:
+                # Sorting also repairs lists which were not kept sorted.
+                communities.append(self.id)
+                communities.sort()
+            if oaiset is not None and not oaiset.has_record(record):
+                oaiset.add_record(record)
+        CommunityMember.add(self.id, [record.id for record in records])
 
     def remove_record(self, record):
         """Remove an already accepted record from the community.
@@ -309,23 +463,70 @@ class Community(db.Model, Timestamp):
         :param record: Record object.
         :type record: `invenio_records.api.Record`
         """
-        if not self.has_record(record):
-            current_app.logger.warning(
-                'Community removal: record {uuid} was not in community '
-                '"{comm}"'.format(uuid=record.id, comm=self.id))
-        else:
-            key = current_app.config['COMMUNITIES_RECORD_KEY']
-            record[key] = [c for c in record[key] if c != self.id]
+        self.remove_records([record])
 
-        if current_app.config['COMMUNITIES_OAI_ENABLED']:
-            if self.oaiset.has_record(record):
-                self.oaiset.remove_record(record)
+    def remove_records(self, records):
+        """Remove many already accepted records from the community.
+
+        The OAISet of the community is resolved once for all the records, and
+        the membership rows are deleted together (see
+        :class:`CommunityMember`).
+
+        :param records: Iterable of record objects.
+        :type records: iterable of `invenio_records.api.Record`
+        """
+        key = current_app.config['COMMUNITIES_RECORD_KEY']
+        oaiset = self.oaiset if current_app.config['COMMUNITIES_OAI_ENABLED'] \
+            else None
+
+        records = list(records)
+        for record in records:
+            if not self.has_record(record):
+                current_app.logger.warning(
+                    'Community removal: record {uuid} was not in community '
+                    '"{comm}"'.format(uuid=record.id, comm=self.id))
+            else:
+                record[key] = [c for c in record[key] if c != self.id]
+            if oaiset is not None and oaiset.has_record(record):
+                oaiset.remove_record(record)
+        CommunityMember.remove(self.id, [record.id for record in records])
 
     def has_record(self, record):
         """Check if record is in community."""
         return self.id in \
             record.get(current_app.config['COMMUNITIES_RECORD_KEY'], [])
 
+    @staticmethod
+    def records_filter(community_ids):
+        """Filter the records accepted in all the given communities.
+
+        The filter is a JSONB containment (``@>``) over the community ids of
+        the records metadata, which can use the GIN index of the optional
+        ``invenio_communities_records_index`` migration branch. It is only
+        supported on PostgreSQL.
+
+        :param community_ids: Ids of the communities.
+        :returns: SQL expression filtering ``RecordMetadata``.
+        """
+        json = db.type_coerce(RecordMetadata.json, JSONB)
+        return json[current_app.config['COMMUNITIES_RECORD_KEY']].contains(
+            list(community_ids))
+
+    def record_ids_query(self):
+        """Query the ids of the records accepted in the community.
+
+        On PostgreSQL the records metadata are queried directly (see
+        :meth:`records_filter`). Other databases read the membership table
+        (see :class:`CommunityMember`).
+
+        :returns: Query of one-element rows holding the record ids.
+        """
+        if db.session.bind.dialect.name == 'postgresql':
+            return db.session.query(RecordMetadata.id).filter(
+                self.records_filter([self.id]))
+        return db.session.query(CommunityMember.id_record).filter(
+            CommunityMember.id_community == self.id)
+
     def accept_record(self, record):
         """Accept a record for inclusion in the community.
 
@@ -384,10 +585,7 @@ class Community(db.Model, Timestamp):
         :rtype: str
         """
         if self.logo_ext:
-            return '/api/files/{bucket}/{key}'.format(
-                bucket=current_app.config['COMMUNITIES_BUCKET_UUID'],
-                key='{0}/logo.{1}'.format(self.id, self.logo_ext),
-            )
+            return logo_path(self.id, self.logo_ext)
         return None
 
     @property
@@ -421,17 +619,39 @@ class Community(db.Model, Timestamp):
     def oaiset(self):
         """Return the corresponding OAISet for given community.
 
-        If OAIServer is not installed this property will return None.
+        If OAIServer is not installed this property will return None. The
+        OAISet is resolved once per session and kept on the instance.
 
         :returns: returns OAISet object corresponding to this community.
         :rtype: `invenio_oaiserver.models.OAISet` or None
         """
         if current_app.config['COMMUNITIES_OAI_ENABLED']:
-            from invenio_oaiserver.models import OAISet
-            return OAISet.query.filter_by(spec=self.oaiset_spec).one()
+            oaiset = getattr(self, '_oaiset', None)
+            if oaiset is None or object_session(oaiset) is not db.session() \
+                    or inspect(oaiset).deleted:
+                from invenio_oaiserver.models import OAISet
+                oaiset = OAISet.query.filter_by(spec=self.oaiset_spec).one()
+                self._oaiset = oaiset
+            return oaiset
         else:
             return None
 
+    @classmethod
+    def load_oaisets(cls, communities):
+        """Resolve the OAISets of many communities in one query.
+
+        :param communities: List of communities.
+        :returns: The list of communities.
+        """
+        if current_app.config['COMMUNITIES_OAI_ENABLED'] and communities:
+            from invenio_oaiserver.models import OAISet
+            oaisets = dict(
+                (oaiset.spec, oaiset) for oaiset in OAISet.query.filter(
+                    OAISet.spec.in_(set(c.oaiset_spec for c in communities))))
+            for community in communities:
+                community._oaiset = oaisets.get(community.oaiset_spec)
+        return communities
+
     @property
     def oaiset_url(self):
         """Return the OAISet URL for given community.
@@ -444,15 +664,135 @@ class Community(db.Model, Timestamp):
             verb='ListRecords',
             metadataPrefix='oai_dc', set=self.oaiset_spec, _external=True)
 
-    @property
-    def version_id(self):
-        """Return the version of the community.
 
-        :returns: hash which encodes the community id and its las update.
-        :rtype: str
+listen(Community.__table__, 'after_create', create_search_index)
+listen(Community.__table__, 'before_drop', drop_search_index)
+
+
+class CommunityMember(db.Model):
+    """Accepted membership of a record in a community.
+
+    It mirrors the community ids stored in the records metadata (see
+    ``COMMUNITIES_RECORD_KEY``), so that the records of a community, and the
+    communities of a record, are found through an index.
+    """
+
+    __tablename__ = 'communities_community_member'
+
+    id_community = db.Column(
+        db.String(100),
+        db.ForeignKey(
+            Community.id,
+            # Explicitly naming the FK because of name length limit in MySQL
+            name='fk_communities_community_member_id_community'),
+        primary_key=True,
+    )
+    """Id of the community."""
+
+    id_record = db.Column(
+        UUIDType,
+        db.ForeignKey(
+            RecordMetadata.id,
+            name='fk_communities_community_member_id_record'),
+        primary_key=True,
+        index=True,
+    )
+    """Id of the record accepted in the community."""
+
+    accepted_at = db.Column(db.DateTime, nullable=True, default=None)
+    """Time at which the record was accepted (unknown for rebuilt rows)."""
+
+    chunk_size = 500
+    """Maximum number of record ids used in one statement."""
+
+    @classmethod
+    def _chunks(cls, record_ids):
+        """Split record ids in lists of at most ``chunk_size`` ids."""
+        record_ids = list(record_ids)
+        for i in range(0, len(record_ids), cls.chunk_size):
+            yield record_ids[i:i + cls.chunk_size]
+
+    @classmethod
+    def add(cls, community_id, record_ids):
+        """Add records to a community, skipping the existing members.
+
+        :param community_id: Id of the community.
+        :param record_ids: Ids of the records.
+        """
+        now = datetime.utcnow()
+        for chunk in cls._chunks(set(record_ids)):
+            existing = set(id_record for id_record, in db.session.query(
+                cls.id_record).filter(
+                    cls.id_community == community_id,
+                    cls.id_record.in_(chunk)))
+            rows = [
+                dict(id_community=community_id, id_record=id_record,
+                     accepted_at=now)
+                for id_record in chunk if id_record not in existing
+            ]
+            if rows:
+                db.session.execute(cls.__table__.insert(), rows)
+
+    @classmethod
+    def remove(cls, community_id, record_ids):
+        """Remove records from a community.
+
+        :param community_id: Id of the community.
+        :param record_ids: Ids of the records.
+        """
+        for chunk in cls._chunks(record_ids):
+            db.session.execute(cls.__table__.delete().where(db.and_(
+                cls.id_community == community_id,
+                cls.id_record.in_(chunk),
+            )))
+
+    @classmethod
+    def rebuild(cls, chunk_size=1000):
+        """Synchronize the table with the records metadata.
+
+        The records are scanned in chunks of ids, each committed separately.
+        The missing rows are inserted and the stale rows are deleted, so
+        that the acceptance times of the correct rows are kept.
+
+        :param chunk_size: Number of records processed per transaction.
+        :returns: Tuple of the numbers of inserted and deleted rows.
         """
-        return hashlib.sha1('{0}__{1}'.format(
-            self.id, self.updated).encode('utf-8')).hexdigest()
+        key = current_app.config['COMMUNITIES_RECORD_KEY']
+        community_ids = set(id_ for id_, in db.session.query(Community.id))
+        inserted = deleted = 0
+        last_id = None
+        while True:
+            query = db.session.query(RecordMetadata.id, RecordMetadata.json)
+            if last_id is not None:
+                query = query.filter(RecordMetadata.id > last_id)
+            chunk = query.order_by(RecordMetadata.id).limit(chunk_size).all()
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+
+            expected = set(
+                (id_community, id_record)
+                for id_record, json in chunk
+                for id_community in (json or {}).get(key, [])
+                if id_community in community_ids
+            )
+            current = set(db.session.query(
+                cls.id_community, cls.id_record).filter(
+                    cls.id_record.in_([id_record for id_record, _ in chunk])))
+
+            missing, stale = expected - current, current - expected
+            if missing:
+                db.session.execute(cls.__table__.insert(), [
+                    dict(id_community=c, id_record=r) for c, r in missing])
+            for id_community, id_record in stale:
+                db.session.execute(cls.__table__.delete().where(db.and_(
+                    cls.id_community == id_community,
+                    cls.id_record == id_record,
+                )))
+            db.session.commit()
+            inserted += len(missing)
+            deleted += len(stale)
+        return inserted, deleted
 
 
 class FeaturedCommunity(db.Model, Timestamp):
@@ -473,7 +813,7 @@ class FeaturedCommunity(db.Model, Timestamp):
     """Id of the featured community."""
 
     start_date = db.Column(
-        db.DateTime, nullable=False, default=datetime.utcnow)
+        db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     """Start date of the community featuring."""
 
     #
@@ -29,5 +29,9 @@ from __future__ import absolute_import, print_function
 from flask import current_app
 from werkzeug.local import LocalProxy
 
+current_communities = LocalProxy(
+    lambda: current_app.extensions['invenio-communities'])
+"""Proxy to the current Invenio-Communities extension."""
+
 current_permission_factory = LocalProxy(
     lambda: current_app.extensions['invenio-communities'].permission_factory)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Hard deletion of the communities marked for deletion."""
+
+from __future__ import absolute_import, print_function
+
+from flask import current_app
+from invenio_db import db
+from invenio_records.api import Record
+
+from .indexer import index_after_commit
+from .models import Community, CommunityMember, FeaturedCommunity, \
+    InclusionRequest
+
+
+def search_record_ids(community_id):
+    """Stream the ids of the records of a community with the search engine.
+
+    The record indexes (see ``COMMUNITIES_INDEX_PREFIX``) are scrolled
+    without fetching the documents.
+
+    :param community_id: Id of the community.
+    :returns: Iterator of record ids.
+    """
+    from elasticsearch.helpers import scan
+    from invenio_search import current_search_client
+
+    hits = scan(
+        current_search_client,
+        index='{0}*'.format(current_app.config['COMMUNITIES_INDEX_PREFIX']),
+        query={
+            'query': {'term': {
+                current_app.config['COMMUNITIES_RECORD_KEY']: community_id,
+            }},
+            '_source': False,
+        },
+    )
+    return (hit['_id'] for hit in hits)
+
+
+def member_record_ids(community_id, chunk_size=1000):
+    """Stream the ids of the records of a community from the database.
+
+    The ids are read from the membership table (see
+    :class:`invenio_communities.models.CommunityMember`), which must be kept
+    in sync with the records (e.g. with ``communities rebuild-members``).
+
+    :param community_id: Id of the community.
+    :param chunk_size: Number of rows fetched at a time.
+    :returns: Iterator of record ids.
+    """
+    rows = db.session.query(CommunityMember.id_record).filter(
+        CommunityMember.id_community == community_id
+    ).yield_per(chunk_size)
+    return (str(id_record) for id_record, in rows)
+
+
+def chunked(iterable, size):
+    """Split an iterable in lists of a given size."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def remove_community_from_records(community_id, record_ids):
+    """Remove a community from records and commit them.
+
+    Records which are not in the community anymore (e.g. handled by an
+    earlier, interrupted purge) are skipped, so the operation can be
+    repeated safely.
+
+    :param community_id: Id of the community.
+    :param record_ids: Ids of the records.
+    :returns: Number of modified records.
+    """
+    community = Community.get(community_id, with_deleted=True)
+    if community is None:
+        return 0
+    records = [r for r in Record.get_records(record_ids)
+               if community.has_record(r)]
+    community.remove_records(records)
+    for record in records:
+        record.commit()
+    index_after_commit([r.id for r in records], partial=True)
+    db.session.commit()
+    return len(records)
+
+
+def delete_community(community_id):
+    """Delete a community with its requests, members and featured entries.
+
+    The community is only deleted once no record references it anymore
+    (see :meth:`invenio_communities.models.Community.record_ids_query`).
+
+    :param community_id: Id of the community.
+    :returns: ``False`` if records still reference the community.
+    """
+    community = Community.get(community_id, with_deleted=True)
+    if community is None:
+        return True
+    if community.record_ids_query().limit(1).first() is not None:
+        return False
+    requests = InclusionRequest.query.filter_by(id_community=community_id)
+    index_after_commit(
+        [r.id_record for r in requests.with_entities(
+            InclusionRequest.id_record)], partial=True)
+    requests.delete(synchronize_session=False)
+    CommunityMember.query.filter_by(id_community=community_id).delete(
+        synchronize_session=False)
+    FeaturedCommunity.query.filter_by(id_community=community_id).delete(
+        synchronize_session=False)
+    db.session.delete(community)
+    db.session.commit()
+    return True
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Ranking of communities."""
+
+from __future__ import absolute_import, print_function
+
+from datetime import datetime
+
+from flask import current_app
+from invenio_db import db
+
+from .models import Community, CommunityMember
+from .proxies import current_communities
+from .utils import obj_or_import_string
+
+
+def default_ranking_score(record_count, last_record_accepted, fixed_points,
+                          now):
+    """Compute the ranking score of a community.
+
+    The score is the number of accepted records, plus a bonus of up to 30
+    points for communities which accepted a record in the last 30 days, plus
+    the fixed points of the community.
+
+    :param record_count: Number of records accepted in the community.
+    :param last_record_accepted: Time of the last record acceptance.
+    :param fixed_points: Points always added to the score.
+    :param now: Time of the ranking.
+    :returns: Ranking score.
+    :rtype: int
+    """
+    recency = max(0, 30 - (now - last_record_accepted).days)
+    return int(record_count + recency + fixed_points)
+
+
+def search_record_counts():
+    """Count the records accepted in each community with the search engine.
+
+    A terms aggregation is run over the record indexes (see
+    ``COMMUNITIES_INDEX_PREFIX``).
+
+    :returns: Dictionary of record counts by community id.
+    """
+    from invenio_search import current_search_client
+
+    result = current_search_client.search(
+        index='{0}*'.format(current_app.config['COMMUNITIES_INDEX_PREFIX']),
+        body={
+            'size': 0,
+            'aggs': {
+                'communities': {
+                    'terms': {
+                        'field': current_app.config['COMMUNITIES_RECORD_KEY'],
+                        'size': Community.query.count() or 1,
+                    },
+                },
+            },
+        },
+    )
+    return dict(
+        (bucket['key'], bucket['doc_count'])
+        for bucket in result['aggregations']['communities']['buckets']
+    )
+
+
+def member_record_counts():
+    """Count the records accepted in each community from the database.
+
+    The records are counted in the membership table (see
+    :class:`invenio_communities.models.CommunityMember`).
+
+    :returns: Dictionary of record counts by community id.
+    """
+    return dict(db.session.query(
+        CommunityMember.id_community, db.func.count(CommunityMember.id_record)
+    ).group_by(CommunityMember.id_community))
+
+
+def rank_communities(now=None, chunk_size=1000):
+    """Recompute the ranking of all the communities.
+
+    The scores are computed from the accepted record counts (see
+    ``COMMUNITIES_RANKING_RECORD_COUNTS``) with the configured scoring
+    function (see ``COMMUNITIES_RANKING_SCORE``). Only the changed rankings
+    are written, bypassing the ORM, with one set-based ``UPDATE`` statement
+    per chunk of communities (the new rankings being selected with a
+    ``CASE`` expression). The version of the changed communities is bumped
+    as well, so that the validators change with the order, while their
+    update time is left untouched as the ranking is not part of their
+    serialized content.
+
+    :param now: Time of the ranking (defaults to now).
+    :param chunk_size: Number of rows fetched, and of rankings written, at a
+        time.
+    :returns: Number of communities whose ranking changed.
+    """
+    now = now or datetime.utcnow()
+    score = obj_or_import_string(
+        current_app.config['COMMUNITIES_RANKING_SCORE'])
+    counts = obj_or_import_string(
+        current_app.config['COMMUNITIES_RANKING_RECORD_COUNTS'])()
+
+    rows = db.session.query(
+        Community.id, Community.last_record_accepted,
+        Community.fixed_points, Community.ranking,
+    ).filter(Community.deleted_at.is_(None)).yield_per(chunk_size)
+
+    changes = []
+    for id_, last_record_accepted, fixed_points, ranking in rows:
+        new_ranking = score(counts.get(id_, 0), last_record_accepted,
+                            fixed_points, now)
+        if new_ranking != ranking:
+            changes.append((id_, new_ranking))
+
+    table = Community.__table__
+    for start in range(0, len(changes), chunk_size):
+        chunk = dict(changes[start:start + chunk_size])
+        db.session.execute(
+            table.update().where(
+                table.c.id.in_(list(chunk))
+            ).values(ranking=db.case(chunk, value=table.c.id),
+                     version_id=table.c.version_id + 1)
+        )
+    if changes:
+        # The rows changed behind the ORM, invalidate the caches.
+        current_communities.community_cache.clear()
+        db.session.info['communities_listing_changed'] = True
+    return len(changes)
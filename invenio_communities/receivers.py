@@ -28,8 +28,11 @@ from __future__ import absolute_import, print_function
 
 from flask import current_app
 from invenio_db import db
+from sqlalchemy.orm import object_session
 
+from .indexer import get_prefetched_provisional_communities
 from .models import InclusionRequest
+from .proxies import current_communities
 from .utils import send_community_request_email
 
 
@@ -46,9 +49,53 @@ def inject_provisional_community(sender, json=None, record=None, index=None,
             current_app.config['COMMUNITIES_INDEX_PREFIX']):
         return
 
-    json['provisional_communities'] = list(sorted([
-        r.id_community for r in InclusionRequest.get_by_record(record.id)
-    ]))
+    communities = get_prefetched_provisional_communities(record.id)
+    if communities is None:
+        pending = current_communities.pending_requests
+        if pending is not None and record.id not in pending:
+            communities = []
+        else:
+            communities = sorted(
+                r.id_community
+                for r in InclusionRequest.get_by_record(record.id))
+            if pending is not None and not communities:
+                pending.record_false_positive()
+    json['provisional_communities'] = list(communities)
+
+
+def add_pending_request(mapper, connection, request):
+    """Signal for adding the record of a new request to the pending filter."""
+    pending = current_communities.pending_requests
+    if pending is not None:
+        pending.add(request.id_record)
+        object_session(request).info['communities_requests_created'] = True
+
+
+def announce_pending_requests(session):
+    """Signal for announcing the new requests to the other processes.
+
+    Only the outermost commit announces them, once they are visible to the
+    other processes, and before the records are sent to the indexer.
+    """
+    if session.transaction.nested:
+        return
+    if session.info.pop('communities_requests_created', None):
+        pending = current_communities.pending_requests
+        if pending is not None:
+            pending.bump()
+
+
+def clear_pending_requests(session, transaction):
+    """Signal for forgetting the new requests when a transaction ends."""
+    if transaction.parent is None:
+        session.info.pop('communities_requests_created', None)
+
+
+def discard_pending_request(mapper, connection, request):
+    """Signal for discarding the record of a deleted request."""
+    pending = current_communities.pending_requests
+    if pending is not None:
+        pending.discard(request.id_record)
 
 
 def create_oaipmh_set(mapper, connection, community):
@@ -59,11 +106,13 @@ def create_oaipmh_set(mapper, connection, community):
                      name=community.title,
                      description=community.description)
         db.session.add(obj)
+    community._oaiset = obj
 
 
 def destroy_oaipmh_set(mapper, connection, community):
     """Signal for creating OAI-PMH sets during community creation."""
     from invenio_oaiserver.models import OAISet
+    community._oaiset = None
     with db.session.begin_nested():
         oaiset = OAISet.query.filter_by(
             spec=community.oaiset_spec).one_or_none()
@@ -71,3 +120,39 @@ def destroy_oaipmh_set(mapper, connection, community):
             raise Exception(
                 "OAISet for community {0} is missing".format(community.id))
         db.session.delete(oaiset)
+
+
+def invalidate_community_cache(mapper, connection, community):
+    """Signal for removing an updated or deleted community from the cache."""
+    current_communities.community_cache.invalidate(community.id)
+
+
+def clear_community_cache(session, *args, **kwargs):
+    """Signal for clearing the community cache on rollback.
+
+    Rows read inside the rolled back transaction may have been cached.
+    """
+    current_communities.community_cache.clear()
+
+
+def mark_listing_changed(mapper, connection, target):
+    """Signal for recording that the community listings changed."""
+    object_session(target).info['communities_listing_changed'] = True
+
+
+def bump_listing_generation(session):
+    """Signal for invalidating the cached listings after a commit.
+
+    Releasing a savepoint also bumps the generation, the outermost commit
+    bumps it again once the changes are visible to other workers.
+    """
+    if session.info.get('communities_listing_changed'):
+        listing_cache = current_communities.listing_cache
+        if listing_cache is not None:
+            listing_cache.bump()
+
+
+def clear_listing_changes(session, transaction):
+    """Signal for forgetting the listing changes when a transaction ends."""
+    if transaction.parent is None:
+        session.info.pop('communities_listing_changed', None)
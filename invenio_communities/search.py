@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Search backends for filtering communities.
+
+A search backend receives the base community query and the search pattern
+and returns the filtered query together with an optional relevance ordering.
+The backend is selected with ``COMMUNITIES_SEARCH_BACKEND``:
+
+* :class:`LikeSearchBackend` (default) matches substrings with ``ILIKE``
+  and works on every database, at the price of a full table scan.
+* :class:`PostgreSQLSearchBackend` uses a GIN-indexed ``tsvector`` expression
+  over the community id, title and description.
+* :class:`SQLiteSearchBackend` uses an FTS5 shadow table kept in sync by
+  triggers (mainly useful for tests and small installations).
+
+The indexes needed by the full-text backends are created together with the
+``communities_community`` table (see :func:`create_search_index`) and by the
+Alembic recipes on PostgreSQL.
+"""
+
+from __future__ import absolute_import, print_function
+
+import re
+
+from flask import current_app
+from invenio_db import db
+from sqlalchemy.exc import OperationalError
+
+TSVECTOR_CONFIG = 'simple'
+"""Text search configuration used to build the PostgreSQL ``tsvector``."""
+
+TSVECTOR_INDEX = 'ix_communities_community_search'
+"""Name of the PostgreSQL GIN index over the community ``tsvector``."""
+
+TSVECTOR_INDEX_DDL = (
+    "CREATE INDEX {concurrently}" + TSVECTOR_INDEX +
+    " ON communities_community USING gin "
+    "(to_tsvector('" + TSVECTOR_CONFIG + "', "
+    "id || ' ' || title || ' ' || description))"
+)
+"""DDL template for the PostgreSQL GIN index.
+
+The indexed expression must be kept identical to the one built by
+:meth:`PostgreSQLSearchBackend.document`, otherwise the planner will not use
+the index.
+"""
+
+FTS_TABLE = 'communities_community_fts'
+"""Name of the SQLite FTS5 shadow table."""
+
+FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5("
+    "id, title, description)",
+    "CREATE TRIGGER IF NOT EXISTS {0}_ai "
+    "AFTER INSERT ON communities_community BEGIN "
+    "INSERT INTO {0}(id, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS {0}_ad "
+    "AFTER DELETE ON communities_community BEGIN "
+    "DELETE FROM {0} WHERE id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS {0}_au "
+    "AFTER UPDATE OF id, title, description ON communities_community BEGIN "
+    "DELETE FROM {0} WHERE id = old.id; "
+    "INSERT INTO {0}(id, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+]
+"""DDL statements for the SQLite FTS5 shadow table and its triggers.
+
+The shadow table stores its own copy of the text and is joined on the
+community id, as the implicit ``rowid`` of the communities table (whose
+primary key is a string) may be renumbered by ``VACUUM``.
+"""
+
+
+def tokenize(p):
+    """Split a search pattern into word tokens.
+
+    :param p: Search pattern.
+    :returns: List of alphanumeric tokens.
+    """
+    return re.findall(r'\w+', p, re.UNICODE)
+
+
+class LikeSearchBackend(object):
+    """Substring search with ``ILIKE`` over id, title and description.
+
+    Words must appear in the given order, e.g. ``'explicit implicit'``
+    matches ``'Explicit is better than implicit.'``.
+    """
+
+    def search(self, query, model, p):
+        """Filter the query.
+
+        :param query: Base community query.
+        :param model: Community model class.
+        :param p: Search pattern.
+        :returns: Tuple of the filtered query and the relevance ordering
+            (``None`` as this backend does not rank results).
+        """
+        p = '%' + p.replace(' ', '%') + '%'
+        return query.filter(db.or_(
+            model.id.ilike(p),
+            model.title.ilike(p),
+            model.description.ilike(p),
+        )), None
+
+
+class PostgreSQLSearchBackend(object):
+    """Full-text search backed by a GIN-indexed ``tsvector`` expression.
+
+    Every word of the pattern is matched as a prefix, in any order, and
+    results are ranked with ``ts_rank``.
+    """
+
+    @staticmethod
+    def document(model):
+        """Build the ``tsvector`` expression (mirrors the GIN index)."""
+        space = db.literal_column("' '")
+        return db.func.to_tsvector(
+            db.literal_column("'{0}'".format(TSVECTOR_CONFIG)),
+            model.id + space + model.title + space + model.description)
+
+    def search(self, query, model, p):
+        """Filter the query.
+
+        :param query: Base community query.
+        :param model: Community model class.
+        :param p: Search pattern.
+        :returns: Tuple of the filtered query and the relevance ordering.
+        """
+        tokens = tokenize(p)
+        if not tokens:
+            return query, None
+        document = self.document(model)
+        tsquery = db.func.to_tsquery(
+            db.literal_column("'{0}'".format(TSVECTOR_CONFIG)),
+            ' & '.join('{0}:*'.format(t) for t in tokens))
+        return (
+            query.filter(document.op('@@')(tsquery)),
+            db.desc(db.func.ts_rank(document, tsquery)),
+        )
+
+
+class SQLiteSearchBackend(object):
+    """Full-text search backed by an SQLite FTS5 shadow table.
+
+    Every word of the pattern is matched as a prefix, in any order, and
+    results are ranked with the FTS5 ``bm25`` rank.
+    """
+
+    def search(self, query, model, p):
+        """Filter the query.
+
+        :param query: Base community query.
+        :param model: Community model class.
+        :param p: Search pattern.
+        :returns: Tuple of the filtered query and the relevance ordering.
+        """
+        tokens = tokenize(p)
+        if not tokens:
+            return query, None
+        fts = db.table(FTS_TABLE, db.column('id'), db.column('rank'))
+        match = ' '.join('"{0}"*'.format(t) for t in tokens)
+        query = query.join(fts, fts.c.id == model.id).filter(
+            db.literal_column(FTS_TABLE).op('MATCH')(match))
+        # FTS5 rank is lower for better matches.
+        return query, db.asc(fts.c.rank)
+
+
+def create_search_index(target, connection, **kwargs):
+    """Create the full-text index after the communities table is created."""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        connection.execute(TSVECTOR_INDEX_DDL.format(concurrently=''))
+    elif dialect == 'sqlite':
+        try:
+            for statement in FTS_DDL:
+                connection.execute(statement.format(FTS_TABLE))
+        except OperationalError:  # pragma: no cover
+            current_app.logger.warning(
+                'SQLite was built without FTS5, the communities full-text '
+                'index was not created.')
+
+
+def drop_search_index(target, connection, **kwargs):
+    """Drop the SQLite shadow table before the communities table is dropped.
+
+    The PostgreSQL index and the SQLite triggers are dropped together with
+    the table.
+    """
+    if connection.dialect.name == 'sqlite':
+        connection.execute('DROP TABLE IF EXISTS {0}'.format(FTS_TABLE))
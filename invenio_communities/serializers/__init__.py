@@ -26,8 +26,12 @@
 
 from __future__ import absolute_import, print_function
 
+from .compiled import CompiledCommunitySerializer
 from .response import community_responsify
 from .schemas.community import CommunitySchemaV1
 
+community_compiled_serializer = CompiledCommunitySerializer()
+
 community_response = community_responsify(
-    CommunitySchemaV1, 'application/json')
+    CommunitySchemaV1, 'application/json',
+    compiled=community_compiled_serializer)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2018 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Precompiled community serializer."""
+
+from __future__ import absolute_import, print_function
+
+from operator import attrgetter
+
+import six
+
+from invenio_communities.links import community_logo_url, \
+    default_links_item_factory, default_links_pagination_factory
+from invenio_communities.models import Community
+
+
+def _text(value):
+    """Serialize a string like ``marshmallow.fields.String``."""
+    return None if value is None else six.text_type(value)
+
+
+def _integer(value):
+    """Serialize an integer like ``marshmallow.fields.Integer``."""
+    return None if value is None else int(value)
+
+
+def _datetime(value):
+    """Serialize a datetime like ``marshmallow.fields.DateTime``.
+
+    Naive datetimes are considered UTC and all datetimes are formatted in
+    UTC, with an explicit offset.
+    """
+    if value is None:
+        return None
+    offset = value.utcoffset()
+    if offset is not None:
+        value = (value - offset).replace(tzinfo=None)
+    return value.isoformat() + '+00:00'
+
+
+class CompiledCommunitySerializer(object):
+    """Serializer producing the output of ``CommunitySchemaV1``.
+
+    The field getters and conversions are resolved once, so that each item
+    is serialized with a single attribute lookup and a few function calls.
+    It accepts community objects as well as rows selecting :attr:`columns`.
+    """
+
+    fields = (
+        ('id', _text),
+        ('title', _text),
+        ('description', _text),
+        ('page', _text),
+        ('curation_policy', _text),
+        ('last_record_accepted', _datetime),
+        ('created', _datetime),
+        ('updated', _datetime),
+        ('id_user', _integer),
+    )
+    """Serialized attributes with their conversion function."""
+
+    extra_columns = ('id', 'logo_ext', 'ranking', 'title')
+    """Attributes needed for the links, the logo URL and the keyset
+    pagination."""
+
+    def __init__(self, only=None):
+        """Initialize the serializer.
+
+        :param only: Names of the serialized fields (defaults to all of
+            them, see :meth:`field_names`).
+        """
+        fields = [(key, convert) for key, convert in self.fields
+                  if only is None or key in only]
+        self.keys = [key for key, convert in fields]
+        self.converters = [convert for key, convert in fields]
+        self.logo_url = only is None or 'logo_url' in only
+        self.getter = attrgetter(*(self.keys + ['id', 'logo_ext']))
+        self._subsets = {}
+
+    @classmethod
+    def field_names(cls):
+        """Return the names of all the serialized fields."""
+        return [key for key, convert in cls.fields] + ['logo_url']
+
+    def only(self, names):
+        """Get a serializer restricted to some fields.
+
+        :param names: Names of the serialized fields.
+        :returns: Serializer, shared by the requests for the same fields.
+        """
+        key = frozenset(names)
+        subset = self._subsets.get(key)
+        if subset is None:
+            subset = self._subsets[key] = type(self)(only=key)
+        return subset
+
+    @property
+    def columns(self):
+        """Columns to select for the serializer."""
+        names = self.keys + [
+            name for name in self.extra_columns if name not in self.keys]
+        return [getattr(Community, name) for name in names]
+
+    def dump(self, obj, links_item_factory=None):
+        """Serialize a community.
+
+        :param obj: Community object or row.
+        :param links_item_factory: Factory of the links of a community.
+        :returns: Dictionary of the serialized community.
+        """
+        links_item_factory = links_item_factory or default_links_item_factory
+        values = self.getter(obj)
+        data = dict(zip(self.keys, [
+            convert(value) for convert, value in zip(self.converters, values)
+        ]))
+        community_id, logo_ext = values[-2:]
+        if self.logo_url:
+            data['logo_url'] = community_logo_url(community_id, logo_ext)
+        data['links'] = links_item_factory(
+            data if 'id' in data else {'id': community_id})
+        return data
+
+    def dump_many(self, objs, total, page=None, urlkwargs=None,
+                  links_item_factory=None, links_pagination_factory=None):
+        """Serialize a list of communities with their envelope.
+
+        :param objs: Community objects or rows.
+        :param total: Total number of hits.
+        :param page: Page of the list, used for the pagination links.
+        :param urlkwargs: Query arguments of the pagination links.
+        :param links_item_factory: Factory of the links of a community.
+        :param links_pagination_factory: Factory of the pagination links.
+        :returns: Dictionary of the serialized list.
+        """
+        hits = [self.dump(obj, links_item_factory) for obj in objs]
+        result = dict(hits=dict(hits=hits, total=total))
+        if page:
+            links_pagination_factory = links_pagination_factory or \
+                default_links_pagination_factory
+            result['links'] = links_pagination_factory(page, urlkwargs or {})
+        return result
@@ -55,25 +55,42 @@ def _format_args():
         )
 
 
-def community_responsify(schema_class, mimetype):
+def community_responsify(schema_class, mimetype, compiled=None):
     """Create a community response serializer.
 
     :param serializer: Serializer instance.
     :param mimetype: MIME type of response.
+    :param compiled: Precompiled serializer used for the lists of
+        communities, producing the same output as the schema.
     """
     def view(data, code=200, headers=None, links_item_factory=None,
-             page=None, urlkwargs=None, links_pagination_factory=None):
-        """Generate the response object."""
+             page=None, urlkwargs=None, links_pagination_factory=None,
+             fields=None):
+        """Generate the response object.
+
+        The serialized fields of the lists can be restricted with ``fields``.
+        """
         if isinstance(data, Community):
             last_modified = data.updated
             response_data = schema_class(
                 context=dict(item_links_factory=links_item_factory)
             ).dump(data).data
+        elif compiled is not None:
+            last_modified = None
+            serializer = compiled.only(fields) if fields else compiled
+            response_data = serializer.dump_many(
+                data.items,
+                total=data.total,
+                page=page,
+                urlkwargs=urlkwargs,
+                links_item_factory=links_item_factory,
+                links_pagination_factory=links_pagination_factory)
         else:
             last_modified = None
             response_data = schema_class(
+                only=fields or None,
                 context=dict(
-                    total=data.query.count(),
+                    total=data.total,
                     item_links_factory=links_item_factory,
                     page=page,
                     urlkwargs=urlkwargs,
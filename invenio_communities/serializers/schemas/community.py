@@ -26,11 +26,10 @@
 
 from __future__ import absolute_import, print_function
 
-from flask import current_app, url_for
 from marshmallow import Schema, fields, post_dump
 
-from invenio_communities.links import default_links_item_factory, \
-    default_links_pagination_factory
+from invenio_communities.links import community_logo_url, \
+    default_links_item_factory, default_links_pagination_factory
 
 
 class CommunitySchemaV1(Schema):
@@ -49,11 +48,7 @@ class CommunitySchemaV1(Schema):
 
     def get_logo_url(self, obj):
         """Get the community logo URL."""
-        if current_app and obj.logo_url:
-            return u'{site_url}{path}'.format(
-                site_url=current_app.config.get('THEME_SITEURL'),
-                path=obj.logo_url,
-            )
+        return community_logo_url(obj.id, obj.logo_ext)
 
     @post_dump(pass_many=False)
     def item_links_addition(self, data):
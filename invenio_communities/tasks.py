@@ -28,25 +28,147 @@ from __future__ import absolute_import, print_function
 
 from datetime import datetime
 
-from celery import shared_task
+from celery import chord, shared_task
+from flask import current_app
 from invenio_db import db
 
+from .indexer import CommunitiesRecordIndexer, index_after_commit, \
+    index_records, update_records
 from .models import Community, InclusionRequest
+from .purge import chunked, delete_community, remove_community_from_records
+from .ranking import rank_communities
+from .utils import obj_or_import_string
 
 
 @shared_task(ignore_result=True)
-def delete_marked_communities():
-    """Delete communities after holdout time."""
-    # TODO: Delete the community ID from all records metadata first
-    raise NotImplementedError()
-    Community.query.filter_by(
-        Community.delete_time > datetime.utcnow()).delete()
-    db.session.commit()
+def delete_marked_communities(chunk_size=500):
+    """Delete communities after holdout time.
+
+    Each community marked for deletion for longer than
+    ``COMMUNITIES_DELETE_HOLDOUT_TIME`` is purged by a separate task.
+
+    :param chunk_size: Number of records updated per transaction.
+    """
+    deleted_before = datetime.utcnow() - \
+        current_app.config['COMMUNITIES_DELETE_HOLDOUT_TIME']
+    community_ids = [id_ for id_, in db.session.query(Community.id).filter(
+        Community.deleted_at < deleted_before)]
+    for community_id in community_ids:
+        purge_community.delay(community_id, chunk_size=chunk_size)
+
+
+@shared_task(ignore_result=True)
+def purge_community(community_id, chunk_size=500, from_database=False):
+    """Remove a community from all its records, then delete it.
+
+    The record ids are streamed (see ``COMMUNITIES_DELETE_RECORD_IDS``) and
+    processed in chunks by parallel tasks, each committing its records. The
+    community is only deleted once all the chunks succeeded. The committed
+    chunks act as checkpoints: if a chunk fails, the next purge of the
+    community only finds the records which still need to be updated.
+
+    :param community_id: Id of the community.
+    :param chunk_size: Number of records updated per transaction.
+    :param from_database: Read the record ids from the database (see
+        :meth:`invenio_communities.models.Community.record_ids_query`),
+        e.g. for the records missed by a stale search index.
+    """
+    if from_database:
+        community = Community.get(community_id, with_deleted=True)
+        record_ids = [] if community is None else \
+            (i for i, in community.record_ids_query())
+    else:
+        record_ids = obj_or_import_string(
+            current_app.config['COMMUNITIES_DELETE_RECORD_IDS'])(community_id)
+    header = [
+        remove_records_chunk.s(community_id, [str(i) for i in chunk])
+        for chunk in chunked(record_ids, chunk_size)
+    ]
+    callback = delete_purged_community.s(
+        community_id, chunk_size=chunk_size, from_database=from_database)
+    if header:
+        chord(header)(callback)
+    else:
+        callback.delay([])
+
+
+@shared_task
+def remove_records_chunk(community_id, record_ids):
+    """Remove a community from a chunk of records."""
+    return remove_community_from_records(community_id, record_ids)
+
+
+@shared_task(ignore_result=True)
+def delete_purged_community(results, community_id, chunk_size=500,
+                            from_database=False):
+    """Delete a community once it was removed from all its records.
+
+    If records still reference the community, they are purged again with
+    their ids read from the database. Should that not suffice (e.g. records
+    added meanwhile), the community is left for the next purge.
+    """
+    if delete_community(community_id):
+        return
+    if from_database:
+        current_app.logger.warning(
+            'Community "{0}" is still referenced by records, its deletion '
+            'is postponed.'.format(community_id))
+    else:
+        purge_community.delay(
+            community_id, chunk_size=chunk_size, from_database=True)
 
 
 @shared_task(ignore_result=True)
-def delete_expired_requests():
-    """Delete expired inclusion requests."""
-    InclusionRequest.query.filter_by(
-        InclusionRequest.expiry_date > datetime.utcnow()).delete()
+def delete_expired_requests(chunk_size=1000):
+    """Delete expired inclusion requests.
+
+    The requests are deleted in chunks, each committed in its own short
+    transaction, so that the table is never locked for long. An interrupted
+    sweep simply resumes with the remaining expired requests on the next
+    run. The records of the deleted requests are reindexed.
+
+    :param chunk_size: Number of requests deleted per transaction.
+    """
+    now = datetime.utcnow()
+    while True:
+        record_ids = InclusionRequest.delete_expired(now=now, limit=chunk_size)
+        index_after_commit(record_ids, partial=True)
+        db.session.commit()
+        if len(record_ids) < chunk_size:
+            break
+
+
+@shared_task(ignore_result=True)
+def update_ranking():
+    """Recompute the ranking of the communities."""
+    rank_communities()
     db.session.commit()
+
+
+@shared_task(ignore_result=True)
+def update_indexed_records(record_ids):
+    """Update the community fields of indexed records in place.
+
+    The records whose document cannot be updated are fully reindexed, as
+    are all the records if the search engine fails.
+
+    :param record_ids: Ids of the records.
+    """
+    try:
+        missing = update_records(record_ids)
+    except Exception:
+        current_app.logger.exception(
+            'Partial update of the indexed records failed.')
+        missing = record_ids
+    if missing:
+        index_records(missing)
+
+
+@shared_task(ignore_result=True)
+def process_bulk_queue():
+    """Process the bulk indexing queue, prefetching provisional communities.
+
+    It replaces the ``invenio_indexer.tasks.process_bulk_queue`` task in the
+    Celery beat schedule (see ``COMMUNITIES_INDEXING_PREFETCH_SIZE``).
+    """
+    CommunitiesRecordIndexer().process_bulk_queue()
@@ -25,16 +25,31 @@
 
 from __future__ import absolute_import, print_function
 
+import base64
+import json
 import os
 from io import SEEK_END, SEEK_SET
 from math import ceil
 from uuid import UUID
 
+import six
 from flask import current_app
 from invenio_db import db
 from invenio_files_rest.errors import FilesException
 from invenio_files_rest.models import Bucket, Location, ObjectVersion
 from invenio_records.api import Record
+from werkzeug.utils import import_string
+
+
+def obj_or_import_string(value):
+    """Import a string, or return the given object.
+
+    :param value: Import path (``'module:name'``) or object.
+    :returns: Imported or given object.
+    """
+    if isinstance(value, six.string_types):
+        return import_string(value)
+    return value
 
 
 class Pagination(object):
@@ -76,6 +91,160 @@ class Pagination(object):
                 last = num
 
 
+def encode_cursor(values):
+    """Encode the keyset values of a row into an opaque cursor.
+
+    :param values: List of JSON-serializable values.
+    :returns: URL-safe cursor string.
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps(values, separators=(',', ':')).encode('utf-8')
+    ).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode an opaque cursor into the keyset values.
+
+    :param cursor: Cursor created by :func:`encode_cursor`.
+    :returns: List of keyset values.
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(
+            (cursor + padding).encode('ascii')).decode('utf-8'))
+    except (TypeError, UnicodeError, ValueError) as e:
+        raise ValueError('Invalid cursor: {0}'.format(e))
+    scalars = six.string_types + six.integer_types + (float, )
+    if not isinstance(values, list) or \
+            not all(isinstance(v, scalars) for v in values):
+        raise ValueError('Invalid cursor.')
+    return values
+
+
+def _matches_type(column, value):
+    """Check that a cursor value can be compared with a column."""
+    python_type = column.type.python_type
+    if issubclass(python_type, six.string_types):
+        return isinstance(value, six.string_types)
+    if issubclass(python_type, six.integer_types):
+        return isinstance(value, six.integer_types) and \
+            not isinstance(value, bool)
+    return isinstance(value, python_type)
+
+
+class KeysetPagination(object):
+    """Cursor-based pagination over an ordered query.
+
+    Instead of skipping ``OFFSET`` rows, each page continues after the keyset
+    values of the last row of the previous page, so that every page is an
+    index seek. All keyset columns are sorted in the same direction and the
+    last one must be unique.
+    """
+
+    def __init__(self, query, columns, per_page, cursor=None,
+                 descending=False):
+        """Fetch the page following the given cursor.
+
+        :param query: Query to paginate (its ordering is replaced).
+        :param columns: Keyset columns, the last one being unique.
+        :param per_page: Number of items per page.
+        :param cursor: Cursor of the page, or ``None`` for the first page.
+        :param descending: Whether the keyset columns are sorted descending.
+        :raises ValueError: If the cursor is malformed.
+        """
+        self.query = query
+        self.per_page = per_page
+        self.cursor = cursor or None
+
+        order = db.desc if descending else db.asc
+        q = query.order_by(None).order_by(*[order(c) for c in columns])
+        if self.cursor:
+            values = decode_cursor(self.cursor)
+            if len(values) != len(columns) or not all(
+                    _matches_type(c, v) for c, v in zip(columns, values)):
+                raise ValueError('Invalid cursor.')
+            keys, values = db.tuple_(*columns), db.tuple_(*values)
+            q = q.filter(keys < values if descending else keys > values)
+
+        items = q.limit(per_page + 1).all()
+        self.has_next = len(items) > per_page
+        self.items = items[:per_page]
+        self.next_cursor = encode_cursor(
+            [getattr(self.items[-1], c.key) for c in columns]
+        ) if self.has_next else None
+        self.total = None
+
+    @property
+    def has_prev(self):
+        """Return true if it is not the first page."""
+        return self.cursor is not None
+
+
+class LookaheadPagination(object):
+    """Offset pagination which does not count the results.
+
+    One row more than the page size is fetched to know whether there is a
+    next page, so that no ``COUNT`` query is needed.
+    """
+
+    def __init__(self, query, page, per_page):
+        """Fetch the given page.
+
+        :param query: Query to paginate.
+        :param page: Page number, starting at 1.
+        :param per_page: Number of items per page.
+        """
+        self.query = query
+        self.page = page
+        self.per_page = per_page
+
+        items = query.limit(per_page + 1).offset(
+            (page - 1) * per_page).all()
+        self.has_next = len(items) > per_page
+        self.items = items[:per_page]
+        self.total = None
+
+    @property
+    def has_prev(self):
+        """Return true if it has previous page."""
+        return self.page > 1
+
+    @property
+    def prev_num(self):
+        """Return the previous page number."""
+        return self.page - 1
+
+    @property
+    def next_num(self):
+        """Return the next page number."""
+        return self.page + 1
+
+
+def estimate_count(query):
+    """Estimate the number of results of a query.
+
+    On PostgreSQL the row estimate of the query planner is used, which does
+    not scan the matching rows. Other databases fall back to an exact count.
+
+    :param query: Query to count.
+    :returns: Estimated number of results.
+    :rtype: int
+    """
+    query = query.order_by(None)
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return query.count()
+    compiled = query.statement.compile(dialect=connection.dialect)
+    plan = connection.execute(
+        'EXPLAIN (FORMAT JSON) {0}'.format(compiled), compiled.params
+    ).scalar()
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
 def render_template_to_string(input, _from_string=False, **context):
     """Render a template from the template folder with the given context.
 
@@ -95,6 +264,24 @@ def render_template_to_string(input, _from_string=False, **context):
     return template.render(context)
 
 
+def logo_key(community_id, logo_ext):
+    """Get the key of a community logo in the communities bucket."""
+    return u'{0}/logo.{1}'.format(community_id, logo_ext)
+
+
+def logo_path(community_id, logo_ext):
+    """Get the path of a community logo in the files REST API.
+
+    :param community_id: Id of the community.
+    :param logo_ext: Extension of the logo.
+    :returns: Path of the logo.
+    """
+    return u'/api/files/{bucket}/{key}'.format(
+        bucket=current_app.config['COMMUNITIES_BUCKET_UUID'],
+        key=logo_key(community_id, logo_ext),
+    )
+
+
 def save_and_validate_logo(logo_stream, logo_filename, community_id):
     """Validate if communities logo is in limit size and save it."""
     cfg = current_app.config
@@ -111,7 +298,7 @@ def save_and_validate_logo(logo_stream, logo_filename, community_id):
         return None
 
     if ext in cfg['COMMUNITIES_LOGO_EXTENSIONS']:
-        key = "{0}/logo.{1}".format(community_id, ext)
+        key = logo_key(community_id, ext)
         logo_stream.seek(0)  # Rewind the stream to the beginning
         ObjectVersion.create(logos_bucket, key, stream=logo_stream,
                              size=logo_size)
@@ -26,15 +26,27 @@
 
 from __future__ import absolute_import, print_function
 
-from flask import Blueprint, abort
+import hashlib
+import json
+
+from flask import Blueprint, abort, current_app, request, \
+    stream_with_context
+from invenio_db import db
 from invenio_rest import ContentNegotiatedMethodView
+from marshmallow import validate
 from webargs import fields
 from webargs.flaskparser import use_kwargs
 
-from invenio_communities.links import default_links_item_factory, \
-    default_links_pagination_factory
+from invenio_communities.cache import cached_listing
+from invenio_communities.links import community_logo_url, \
+    default_links_item_factory, default_links_pagination_factory
 from invenio_communities.models import Community
-from invenio_communities.serializers import community_response
+from invenio_communities.serializers import community_compiled_serializer, \
+    community_response
+from invenio_communities.serializers.compiled import \
+    CompiledCommunitySerializer
+from invenio_communities.utils import KeysetPagination, \
+    LookaheadPagination, estimate_count
 
 blueprint = Blueprint(
     'invenio_communities_rest',
@@ -65,7 +77,30 @@ class CommunitiesResource(ContentNegotiatedMethodView):
         size=fields.Int(
             location='query',
             missing=20,
-        )
+            validate=validate.Range(min=1),
+        ),
+        cursor=fields.String(
+            location='query',
+            missing=None,
+        ),
+        total=fields.String(
+            location='query',
+            missing='true',
+            validate=validate.OneOf(['true', 'false', 'estimate']),
+        ),
+        ids=fields.DelimitedList(
+            fields.String(),
+            location='query',
+            missing=None,
+        ),
+        field_names=fields.DelimitedList(
+            fields.String(),
+            location='query',
+            load_from='fields',
+            missing=None,
+            validate=validate.ContainsOnly(
+                CompiledCommunitySerializer.field_names()),
+        ),
     )
 
     def __init__(self, serializers=None, *args, **kwargs):
@@ -76,10 +111,33 @@ class CommunitiesResource(ContentNegotiatedMethodView):
             **kwargs
         )
 
+    @cached_listing('communities_list')
     @use_kwargs(get_args)
-    def get(self, query, sort, page, size):
+    def get(self, query, sort, page, size, cursor, total, ids, field_names):
         """Get a list of all the communities.
 
+        The list is paginated with ``page`` and ``size``. Alternatively,
+        passing a ``cursor`` (empty for the first page) switches to keyset
+        pagination for the ``ranking`` and ``title`` sort orders: the ``next``
+        link then carries an opaque cursor instead of a page number, so that
+        deep pages are as cheap as the first one.
+
+        The ``total`` of hits is counted once per request. Clients that only
+        page forward can skip the count with ``total=false`` (the total is
+        then ``null``) or get the query planner estimate with
+        ``total=estimate``.
+
+        The serialized fields can be restricted with a comma-separated list of
+        names in ``fields`` (e.g. ``fields=id,title``), in which case only
+        the needed columns are read from the database.
+
+        Passing a comma-separated list of community ``ids`` returns these
+        communities instead (see :meth:`post`).
+
+        The response carries an ``ETag`` derived from the last update time
+        and the number of communities, and a ``304 Not Modified`` is returned
+        for a matching ``If-None-Match`` header.
+
         .. http:get:: /communities/(string:id)
             Returns a JSON list with all the communities.
             **Request**:
@@ -105,28 +163,127 @@ class CommunitiesResource(ContentNegotiatedMethodView):
             :resheader Content-Type: application/json
             :statuscode 200: no error
         """
+        if ids is not None:
+            return self.multi_get(ids)
+
         urlkwargs = {
             'q': query,
             'sort': sort,
             'size': size,
         }
+        if total != 'true':
+            urlkwargs['total'] = total
+        if field_names:
+            urlkwargs['fields'] = ','.join(field_names)
+        serializer = community_compiled_serializer.only(field_names) \
+            if field_names else community_compiled_serializer
+
+        # The whole table validator changes with every write, so that
+        # unchanged lists are answered before paginating and serializing.
+        last_modified, count, versions = Community.get_collection_version()
+        etag = hashlib.sha1(u'{0}__{1}__{2}__{3}'.format(
+            last_modified, count, versions, request.url).encode('utf-8')
+        ).hexdigest()
+        self.check_etag(etag)
+
+        # Only the serialized columns are loaded, as plain rows.
+        communities = Community.filter_communities(query, sort).with_entities(
+            *serializer.columns)
+        if cursor is not None:
+            columns, descending = Community.keyset_columns(sort)
+            try:
+                page = KeysetPagination(communities, columns, size,
+                                        cursor=cursor, descending=descending)
+            except ValueError:
+                abort(400)
+        elif total == 'true':
+            page = communities.paginate(page, size)
+        else:
+            # Same as ``paginate()``, which aborts on invalid pages.
+            if page < 1:
+                abort(404)
+            page = LookaheadPagination(communities, page, size)
 
-        communities = Community.filter_communities(query, sort)
-        page = communities.paginate(page, size)
+        if total == 'estimate':
+            page.total = estimate_count(communities)
+        elif total == 'true' and page.total is None:
+            page.total = communities.order_by(None).count()
 
         links = default_links_pagination_factory(page, urlkwargs)
 
         links_headers = map(lambda key: ('link', 'ref="{0}" href="{1}"'.format(
             key, links[key])), links)
 
-        return self.make_response(
+        response = self.make_response(
             page,
             headers=links_headers,
             links_item_factory=default_links_item_factory,
             page=page,
             urlkwargs=urlkwargs,
             links_pagination_factory=default_links_pagination_factory,
+            fields=field_names,
         )
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        return response
+
+    @use_kwargs(dict(ids=fields.List(
+        fields.String(), location='json', required=True)))
+    def post(self, ids):
+        """Get many communities at once.
+
+        .. http:post:: /communities/
+            Returns the id, title and logo URL of the given communities, in
+            the requested order. Unknown and deleted communities are skipped.
+            **Request**:
+            .. sourcecode:: http
+                POST /communities/ HTTP/1.1
+                Content-Type: application/json
+                {"ids": ["comm1", "comm2"]}
+            **Response**:
+            .. sourcecode:: http
+                HTTP/1.0 200 OK
+                Content-Type: application/json
+                {
+                    "hits": {
+                        "hits": [
+                            {"id": "comm1", "title": "", "logo_url": null}
+                        ],
+                        "total": 1
+                    }
+                }
+            :statuscode 200: no error
+            :statuscode 400: too many ids
+        """
+        return self.multi_get(ids)
+
+    def multi_get(self, ids):
+        """Get compact entries of many communities with one query."""
+        if len(ids) > current_app.config['COMMUNITIES_MULTIGET_MAX_IDS']:
+            abort(400)
+        rows = dict((row.id, row) for row in db.session.query(
+            Community.id, Community.title, Community.logo_ext,
+            Community.version_id,
+        ).filter(
+            Community.id.in_(set(ids)), Community.deleted_at.is_(None)))
+        rows = [rows.pop(id_) for id_ in ids if id_ in rows]
+
+        etag = hashlib.sha1(u'|'.join(
+            u'{0}__{1}'.format(row.id, row.version_id) for row in rows
+        ).encode('utf-8')).hexdigest()
+        self.check_etag(etag)
+
+        response = current_app.response_class(json.dumps(dict(hits=dict(
+            hits=[dict(
+                id=row.id,
+                title=row.title,
+                logo_url=community_logo_url(row.id, row.logo_ext),
+            ) for row in rows],
+            total=len(rows),
+        ))), mimetype='application/json')
+        response.set_etag(etag)
+        return response
 
 
 class CommunityDetailsResource(ContentNegotiatedMethodView):
@@ -177,13 +334,54 @@ class CommunityDetailsResource(ContentNegotiatedMethodView):
         community = Community.get(community_id)
         if not community:
             abort(404)
-        etag = community.version_id
+        # A community re-created with the same id starts a new version.
+        etag = hashlib.sha1(u'{0}__{1}__{2}'.format(
+            community.id, community.created.isoformat(),
+            community.version_id).encode('utf-8')).hexdigest()
         self.check_etag(etag)
         response = self.make_response(
             community, links_item_factory=default_links_item_factory)
         response.set_etag(etag)
         return response
 
+
+def export_communities(since):
+    """Export all the communities as newline-delimited JSON.
+
+    Each line is a community, serialized like the items of the list. The
+    communities are ordered by update time and streamed from a server-side
+    cursor, so that the memory usage does not depend on their number. An
+    interrupted export can be resumed by passing the ``updated`` time of the
+    last received community as ``since`` (communities updated at that exact
+    time are sent again).
+
+    .. http:get:: /communities/export.ndjson
+        :query string since: Only export the communities updated since this
+            ISO 8601 time.
+        :resheader Content-Type: application/x-ndjson
+        :statuscode 200: no error
+    """
+    columns = community_compiled_serializer.columns
+    query = db.session.query(*columns).filter(
+        Community.deleted_at.is_(None))
+    if since is not None:
+        if since.tzinfo is not None:
+            since = (since - since.utcoffset()).replace(tzinfo=None)
+        query = query.filter(Community.updated >= since)
+    query = query.order_by(Community.updated, Community.id).execution_options(
+        stream_results=True).yield_per(
+        current_app.config['COMMUNITIES_EXPORT_CHUNK_SIZE'])
+
+    def generate():
+        for row in query:
+            yield json.dumps(
+                community_compiled_serializer.dump(row),
+                separators=(',', ':')) + '\n'
+
+    return current_app.response_class(
+        stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 serializers = {'application/json': community_response}
 
 
@@ -194,7 +392,7 @@ blueprint.add_url_rule(
         serializers=serializers,
         default_media_type='application/json',
     ),
-    methods=['GET']
+    methods=['GET', 'POST']
 )
 
 
@@ -207,3 +405,12 @@ blueprint.add_url_rule(
     ),
     methods=['GET']
 )
+
+
+blueprint.add_url_rule(
+    '/export.ndjson',
+    view_func=use_kwargs(dict(
+        since=fields.DateTime(location='query', missing=None),
+    ))(export_communities),
+    methods=['GET']
+)
@@ -34,15 +34,19 @@ from flask import Blueprint, abort, current_app, flash, jsonify, redirect, \
 from flask_babelex import gettext as _
 from flask_login import current_user, login_required
 from invenio_db import db
-from invenio_indexer.api import RecordIndexer
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_pidstore.resolver import Resolver
 from invenio_records.api import Record
 
+from invenio_communities.cache import cached_listing
+from invenio_communities.errors import CommunitiesError
 from invenio_communities.forms import CommunityForm, DeleteCommunityForm, \
     EditCommunityForm, SearchForm
+from invenio_communities.indexer import index_after_commit
 from invenio_communities.models import Community, FeaturedCommunity
 from invenio_communities.proxies import current_permission_factory
-from invenio_communities.utils import Pagination, render_template_to_string
+from invenio_communities.utils import KeysetPagination, Pagination, \
+    render_template_to_string
 
 blueprint = Blueprint(
     'invenio_communities',
@@ -54,10 +58,15 @@ blueprint = Blueprint(
 
 
 def pass_community(f):
-    """Decorator to pass community."""
+    """Decorator to pass community.
+
+    The community is read through the community cache for the requests which
+    do not modify it.
+    """
     @wraps(f)
     def inner(community_id, *args, **kwargs):
-        c = Community.get(community_id)
+        c = Community.get(community_id,
+                          cached=request.method in ('GET', 'HEAD'))
         if c is None:
             abort(404)
         return f(c, *args, **kwargs)
@@ -93,6 +102,7 @@ def mycommunities_ctx():
 
 
 @blueprint.route('/', methods=['GET', ])
+@cached_listing('index', anonymous_only=True)
 def index():
     """Index page with uploader and list of existing depositions."""
     ctx = mycommunities_ctx()
@@ -100,13 +110,36 @@ def index():
     p = request.args.get('p', type=str)
     so = request.args.get('so', type=str)
     page = request.args.get('page', type=int, default=1)
+    cursor = request.args.get('cursor', type=str)
 
-    so = so or current_app.config.get('COMMUNITIES_DEFAULT_SORTING_OPTION')
+    # A search without an explicit sorting is ordered by relevance, unless
+    # it is paginated with a cursor, which needs keyset columns.
+    if not p or cursor is not None:
+        so = so or current_app.config.get(
+            'COMMUNITIES_DEFAULT_SORTING_OPTION')
 
     communities = Community.filter_communities(p, so)
     featured_community = FeaturedCommunity.get_featured_or_none()
     form = SearchForm(p=p)
     per_page = 10
+
+    if cursor is not None:
+        columns, descending = Community.keyset_columns(so)
+        try:
+            p = KeysetPagination(communities, columns, per_page,
+                                 cursor=cursor, descending=descending)
+        except ValueError:
+            abort(400)
+        ctx.update({
+            'pagination': p,
+            'form': form,
+            'title': _('Communities'),
+            'communities': p.items,
+            'featured_community': featured_community,
+        })
+        return render_template(
+            current_app.config['COMMUNITIES_INDEX_TEMPLATE'], **ctx)
+
     page = max(page, 1)
     p = Pagination(page, per_page, communities.count())
 
@@ -271,6 +304,14 @@ def delete(community):
         return redirect(url_for('.edit', community_id=community.id))
 
 
+CURATION_ACTIONS = {
+    'accept': lambda community, record: community.accept_record(record),
+    'reject': lambda community, record: community.reject_record(record),
+    'remove': lambda community, record: community.remove_record(record),
+}
+"""Curation actions by name."""
+
+
 @blueprint.route('/<string:community_id>/curate/', methods=['GET', 'POST'])
 @login_required
 @pass_community
@@ -278,16 +319,24 @@ def delete(community):
 def curate(community):
     """Index page with uploader and list of existing depositions.
 
+    A POST request performs a curation action (``accept``, ``reject`` or
+    ``remove``) on the record ``recid``, or on many records at once when a
+    list of ``{"recid": ..., "action": ...}`` entries is given as
+    ``records``.
+
     :param community_id: ID of the community to curate.
     """
     if request.method == 'POST':
+        if 'records' in request.json:
+            return curate_records(community, request.json['records'])
+
         action = request.json.get('action')
         recid = request.json.get('recid')
 
         # 'recid' is mandatory
         if not recid:
             abort(400)
-        if action not in ['accept', 'reject', 'remove']:
+        if action not in CURATION_ACTIONS:
             abort(400)
 
         # Resolve recid to a Record
@@ -296,16 +345,11 @@ def curate(community):
         pid, record = resolver.resolve(recid)
 
         # Perform actions
-        if action == "accept":
-            community.accept_record(record)
-        elif action == "reject":
-            community.reject_record(record)
-        elif action == "remove":
-            community.remove_record(record)
+        CURATION_ACTIONS[action](community, record)
 
         record.commit()
+        index_after_commit([record.id], partial=True)
         db.session.commit()
-        RecordIndexer().index_by_id(record.id)
         return jsonify({'status': 'success'})
 
     ctx = {'community': community}
@@ -313,3 +357,60 @@ def curate(community):
         current_app.config['COMMUNITIES_CURATE_TEMPLATE'],
         **ctx
     )
+
+
+def curate_records(community, entries):
+    """Perform curation actions on many records at once.
+
+    All the PIDs are resolved in one query and all the records are fetched in
+    one query. The actions are applied in a single transaction, each in its
+    own savepoint so that one failing action does not prevent the others,
+    and the affected records are indexed together once committed.
+
+    :param community: Community to curate.
+    :param entries: List of ``{"recid": ..., "action": ...}`` dictionaries.
+    :returns: JSON response with the outcome of each entry.
+    """
+    if not isinstance(entries, list) or not all(
+            isinstance(e, dict) and e.get('recid') and
+            e.get('action') in CURATION_ACTIONS for e in entries):
+        abort(400)
+
+    recids = set(str(e['recid']) for e in entries)
+    pids = PersistentIdentifier.query.filter(
+        PersistentIdentifier.pid_type == 'recid',
+        PersistentIdentifier.pid_value.in_(recids),
+        PersistentIdentifier.object_type == 'rec',
+        PersistentIdentifier.status == PIDStatus.REGISTERED,
+    )
+    uuids = dict((pid.pid_value, pid.object_uuid) for pid in pids)
+    records = dict(
+        (record.id, record)
+        for record in Record.get_records(list(uuids.values())))
+
+    results = []
+    modified, indexed = set(), set()
+    for entry in entries:
+        recid, action = str(entry['recid']), entry['action']
+        result = {'recid': entry['recid'], 'action': action}
+        record = records.get(uuids.get(recid))
+        if record is None:
+            result.update(status='error', message='Record not found.')
+        else:
+            try:
+                with db.session.begin_nested():
+                    CURATION_ACTIONS[action](community, record)
+                result['status'] = 'success'
+                indexed.add(record.id)
+                if action != 'reject':
+                    modified.add(record.id)
+            except CommunitiesError:
+                result.update(
+                    status='error', message='Inclusion request missing.')
+        results.append(result)
+
+    for record_id in modified:
+        records[record_id].commit()
+    index_after_commit(indexed, partial=True)
+    db.session.commit()
+    return jsonify({'status': 'success', 'results': results})
@@ -100,6 +100,7 @@ install_requires = [
     'invenio-rest[cors]>=1.0.0a9',
     'invenio-search>=1.0.0a9',
     'marshmallow>=2.15.0',
+    'six>=1.10',
 ]
 
 packages = find_packages()
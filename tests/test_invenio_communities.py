@@ -29,18 +29,35 @@ from __future__ import absolute_import, print_function
 
 import json
 from datetime import datetime, timedelta
+from uuid import uuid4
 
 import pytest
-from flask import Flask
+from flask import Flask, url_for
+from invenio_accounts.testutils import login_user_via_session
 from invenio_oaiserver.models import OAISet
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_records.api import Record
+from mock import patch
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm.exc import StaleDataError
 
 from invenio_communities import InvenioCommunities
+from invenio_communities.bloom import BloomFilter, PendingRequestsFilter
+from invenio_communities.cache import InMemoryStore
 from invenio_communities.errors import CommunitiesError, \
     InclusionRequestExistsError, InclusionRequestMissingError, \
     InclusionRequestObsoleteError
-from invenio_communities.models import Community, FeaturedCommunity, \
-    InclusionRequest
+from invenio_communities.indexer import CommunitiesRecordIndexer, \
+    index_after_commit, prefetch_provisional_communities, update_records
+from invenio_communities.links import default_links_item_factory
+from invenio_communities.models import Community, CommunityMember, \
+    FeaturedCommunity, InclusionRequest
+from invenio_communities.receivers import inject_provisional_community
+from invenio_communities.serializers import CommunitySchemaV1
+from invenio_communities.serializers.compiled import \
+    CompiledCommunitySerializer
+from invenio_communities.utils import encode_cursor
 
 try:
     from werkzeug.urls import url_parse
@@ -197,6 +214,28 @@ def test_oaipmh_sets(app, db, communities):
     assert OAISet.query.count() == 2
 
 
+def test_oaipmh_set_memoization(app, db, communities):
+    """Test that the OAI-PMH Set of a community is resolved once."""
+    (comm1, comm2, comm3) = communities
+    oaiset = comm1.oaiset
+    assert oaiset.spec == 'user-comm1'
+    with patch('invenio_oaiserver.models.OAISet.query') as query:
+        assert comm1.oaiset is oaiset
+        assert not query.filter_by.called
+
+    # The set is resolved again once it left the session
+    db.session.expunge(oaiset)
+    assert comm1.oaiset is not oaiset
+    assert comm1.oaiset.spec == 'user-comm1'
+
+    # Eager loading of the sets of many communities
+    comms = Community.load_oaisets(Community.query.all())
+    with patch('invenio_oaiserver.models.OAISet.query') as query:
+        assert set(c.oaiset.spec for c in comms) == \
+            {'user-comm1', 'user-comm2', 'user-oth3'}
+        assert not query.filter.called
+
+
 def test_communities_rest_all_communities(app, db, communities):
     """Test the OAI-PMH Sets creation."""
     with app.test_client() as client:
@@ -210,6 +249,125 @@ def test_communities_rest_all_communities(app, db, communities):
         )
 
 
+def test_compiled_serializer_parity(app, db, communities):
+    """Test that the compiled serializer matches the marshmallow schema."""
+    (comm1, comm2, comm3) = communities
+    comm1.logo_ext = 'png'
+    comm1.last_record_accepted = datetime(2018, 1, 2, 3, 4, 5, 6)
+    comm2.page = u'Pagé'
+    db.session.commit()
+
+    serializer = CompiledCommunitySerializer()
+    query = Community.query.order_by(Community.id)
+    rows = query.with_entities(*serializer.columns).all()
+    with app.test_request_context('/api/communities/'):
+        expected = CommunitySchemaV1(context=dict(total=3)).dump(
+            query.all(), many=True).data
+        assert serializer.dump_many(rows, total=3) == expected
+        assert serializer.dump_many(query.all(), total=3) == expected
+        assert serializer.dump(comm1) == CommunitySchemaV1().dump(comm1).data
+
+    assert expected['hits']['hits'][0]['logo_url'].endswith(
+        '/api/files/00000000-0000-0000-0000-000000000000/comm1/logo.png')
+    assert expected['hits']['hits'][0]['last_record_accepted'] == \
+        '2018-01-02T03:04:05.000006+00:00'
+
+
+def test_links_item_factory(app, db, communities):
+    """Test that the item links are built from per-request templates."""
+    with app.test_request_context('/api/communities/'):
+        expected = dict(
+            self=url_for('invenio_communities_rest.communities_item',
+                         community_id='comm1', _external=True),
+            html='http://inveniosoftware.org/communities/comm1/',
+        )
+        with patch('invenio_communities.links.url_for',
+                   wraps=url_for) as links_url_for:
+            assert default_links_item_factory({'id': 'comm1'}) == expected
+            links = default_links_item_factory({'id': 'comm2'})
+            assert links['self'] == expected['self'].replace('comm1', 'comm2')
+            assert links_url_for.call_count == 1
+
+
+def test_communities_rest_fields(app, db, communities):
+    """Test the sparse fieldsets of the communities list."""
+    with app.test_client() as client:
+        response = client.get('/api/communities/',
+                              query_string={'fields': 'title,logo_url',
+                                            'size': 1, 'sort': 'title'})
+        assert response.status_code == 200
+        data = get_json(response)
+        hit = data['hits']['hits'][0]
+        assert set(hit) == {'title', 'logo_url', 'links'}
+        assert hit['links']['self'].endswith('/api/communities/oth3')
+        assert 'fields=title' in data['links']['next']
+
+        response = client.get('/api/communities/',
+                              query_string={'fields': 'title,unknown'})
+        assert response.status_code == 422
+
+    # Listings do not load the long columns
+    community = Community.filter_communities(None, 'title').first()
+    assert {'page', 'curation_policy'} <= inspect(community).unloaded
+
+
+def test_communities_rest_multi_get(app, db, communities):
+    """Test fetching many communities at once."""
+    (comm1, comm2, comm3) = communities
+    comm1.logo_ext = 'png'
+    comm3.delete()
+    db.session.commit()
+
+    with app.test_client() as client:
+        response = client.get('/api/communities/?ids=comm2,unknown,oth3,comm1')
+        data = get_json(response, code=200)
+        assert data['hits']['total'] == 2
+        assert [h['id'] for h in data['hits']['hits']] == ['comm2', 'comm1']
+        assert set(data['hits']['hits'][1]) == {'id', 'title', 'logo_url'}
+        assert data['hits']['hits'][1]['logo_url'].endswith('comm1/logo.png')
+        etag = response.headers['ETag']
+
+        response = client.post(
+            '/api/communities/', data=json.dumps({'ids': ['comm2', 'comm1']}),
+            content_type='application/json')
+        assert get_json(response, code=200) == data
+        assert response.headers['ETag'] == etag
+
+        response = client.get('/api/communities/?ids=comm2,comm1',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+        app.config['COMMUNITIES_MULTIGET_MAX_IDS'] = 1
+        response = client.get('/api/communities/?ids=comm2,comm1')
+        assert response.status_code == 400
+
+
+def test_communities_rest_export(app, db, communities):
+    """Test the NDJSON export of the communities."""
+    (comm1, comm2, comm3) = communities
+    comm3.delete()
+    db.session.execute(Community.__table__.update().where(
+        Community.__table__.c.id == 'comm2').values(
+        updated=datetime(2018, 1, 1)))
+    db.session.commit()
+
+    with app.test_client() as client:
+        response = client.get('/api/communities/export.ndjson')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        exported = [json.loads(line) for line in lines]
+        assert [c['id'] for c in exported] == ['comm2', 'comm1']
+        assert exported[1]['title'] == 'Title1'
+        assert 'links' in exported[1]
+
+        # Resume after the first community
+        response = client.get('/api/communities/export.ndjson',
+                              query_string={'since': exported[1]['updated']})
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line)['id'] for line in lines] == ['comm1']
+
+
 def test_community_delete(app, db, communities):
     """Test deletion of communities."""
     (comm1, comm2, comm3) = communities
@@ -300,6 +458,105 @@ def test_communities_rest_pagination(app, db, communities):
         assert 'next' not in data['links']
 
 
+@pytest.mark.parametrize('sort, expected', [
+    ('title', ['oth3', 'comm2', 'comm1']),
+    ('ranking', ['oth3', 'comm2', 'comm1']),
+])
+def test_communities_rest_cursor_pagination(app, db, communities, sort,
+                                            expected):
+    """Test the keyset pagination of the communities list."""
+    with app.test_client() as client:
+        ids = []
+        url = '/api/communities/?size=1&cursor=&sort={0}'.format(sort)
+        while url:
+            response = client.get(url)
+            data = get_json(response, code=200)
+            assert len(data['hits']['hits']) == 1
+            assert data['hits']['total'] == 3
+            assert 'page=' not in data['links']['self']
+            ids.append(data['hits']['hits'][0]['id'])
+            url = None
+            if 'next' in data['links']:
+                assert any('ref="next"' in h[1] and 'cursor=' in h[1]
+                           for h in response.headers)
+                next_url = url_parse(data['links']['next'])
+                url = '{0}?{1}'.format(next_url.path, next_url.query)
+        assert ids == expected
+
+        response = client.get('/api/communities/?cursor=invalid')
+        assert response.status_code == 400
+        response = client.get('/api/communities/?cursor={0}'.format(
+            encode_cursor([{'a': 1}, 'x'])))
+        assert response.status_code == 400
+        response = client.get(
+            '/api/communities/?sort=ranking&cursor={0}'.format(
+                encode_cursor(['abc', 'x'])))
+        assert response.status_code == 400
+        response = client.get(
+            '/api/communities/?sort=title&cursor={0}'.format(
+                encode_cursor([1, 'x'])))
+        assert response.status_code == 400
+        for size in (0, -1):
+            response = client.get(
+                '/api/communities/?cursor=&size={0}'.format(size))
+            assert response.status_code == 422
+
+
+def test_communities_rest_total(app, db, communities):
+    """Test the optional and estimated totals of the communities list."""
+    with app.test_client() as client:
+        data = get_json(client.get('/api/communities/?size=2&total=false'),
+                        code=200)
+        assert data['hits']['total'] is None
+        assert len(data['hits']['hits']) == 2
+        assert 'total=false' in data['links']['next']
+
+        data = get_json(client.get(
+            '/api/communities/?size=2&page=2&total=false'), code=200)
+        assert len(data['hits']['hits']) == 1
+        assert 'prev' in data['links']
+        assert 'next' not in data['links']
+
+        data = get_json(client.get('/api/communities/?total=estimate'),
+                        code=200)
+        assert isinstance(data['hits']['total'], int)
+
+        response = client.get('/api/communities/?total=maybe')
+        assert response.status_code == 422
+
+        for page in (0, -1):
+            for total in ('true', 'false'):
+                response = client.get(
+                    '/api/communities/?page={0}&total={1}'.format(
+                        page, total))
+                assert response.status_code == 404
+
+
+def test_communities_rest_listing_cache(app, db, communities, user):
+    """Test the shared cache of the communities list."""
+    app.config['COMMUNITIES_LISTING_CACHE'] = \
+        'invenio_communities.cache:InMemoryStore'
+    db.session.commit()
+
+    def titles(client):
+        data = get_json(client.get('/api/communities/?sort=title'), code=200)
+        return [c['title'] for c in data['hits']['hits']]
+
+    with app.test_client() as client:
+        assert titles(client) == ['', 'A', 'Title1']
+
+        # Changes bypassing the ORM are not seen: the list is cached
+        db.session.execute(
+            "UPDATE communities_community SET title='B' WHERE id='comm2'")
+        db.session.commit()
+        assert titles(client) == ['', 'A', 'Title1']
+
+        # Committed community writes start a new generation
+        Community.create(community_id='comm4', user_id=user.id, title='C')
+        db.session.commit()
+        assert titles(client) == ['', 'B', 'C', 'Title1']
+
+
 def test_communities_rest_get_details(app, db, communities):
     """Test the OAI-PMH Sets creation."""
     with app.test_client() as client:
@@ -335,6 +592,354 @@ def test_communities_rest_etag(app, communities):
         assert response.get_data(as_text=True) == ''
 
 
+def test_community_version(app, db, communities):
+    """Test the version of the communities."""
+    (comm1, comm2, comm3) = communities
+    assert comm1.version_id == 1
+    with app.test_client() as client:
+        etag = client.get('/api/communities/comm1').headers['ETag']
+
+    comm1.title = 'New title'
+    db.session.commit()
+    assert comm1.version_id == 2
+    with app.test_client() as client:
+        response = client.get('/api/communities/comm1',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    # Concurrent updates are detected
+    db.session.execute(Community.__table__.update().where(
+        Community.__table__.c.id == 'comm1').values(
+        version_id=Community.__table__.c.version_id + 1))
+    comm1.title = 'Other title'
+    with pytest.raises(StaleDataError):
+        db.session.commit()
+
+
+def test_communities_rest_list_etag(app, db, communities):
+    """Test the conditional requests of the communities list."""
+    (comm1, comm2, comm3) = communities
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.get('/api/communities/?size=2')
+        assert response.status_code == 200
+        etag = response.headers.get('ETag')
+        assert etag
+        assert response.headers.get('Last-Modified')
+
+        response = client.get('/api/communities/?size=2', headers=(
+            ('If-None-Match', etag),))
+        assert response.status_code == 304
+        assert response.get_data(as_text=True) == ''
+
+        # Other pages have other validators
+        response = client.get('/api/communities/?size=2&page=2', headers=(
+            ('If-None-Match', etag),))
+        assert response.status_code == 200
+
+        # Any change of the communities changes the validator
+        Community.get('comm2').title = 'New title'
+        db.session.commit()
+        response = client.get('/api/communities/?size=2', headers=(
+            ('If-None-Match', etag),))
+        assert response.status_code == 200
+        assert response.headers.get('ETag') != etag
+
+
+def test_curate_records(app, db, communities, user, disable_request_email):
+    """Test the bulk curation of records."""
+    (comm1, comm2, comm3) = communities
+    communities_key = app.config['COMMUNITIES_RECORD_KEY']
+    records = []
+    for recid in ('1', '2', '3'):
+        record = Record.create({'title': 'Record {0}'.format(recid)})
+        PersistentIdentifier.create(
+            'recid', recid, object_type='rec', object_uuid=record.id,
+            status=PIDStatus.REGISTERED)
+        records.append(record)
+    InclusionRequest.create(community=comm1, record=records[0])
+    InclusionRequest.create(community=comm1, record=records[1])
+    db.session.commit()
+
+    with app.test_client() as client, \
+            patch('invenio_communities.indexer.RecordIndexer') as indexer:
+        login_user_via_session(client, email=user.email)
+        response = client.post(
+            '/communities/comm1/curate/',
+            data=json.dumps({'records': [
+                {'recid': '1', 'action': 'accept'},
+                {'recid': '2', 'action': 'reject'},
+                {'recid': '3', 'action': 'accept'},
+                {'recid': '4', 'action': 'remove'},
+            ]}),
+            content_type='application/json')
+        results = get_json(response, code=200)['results']
+        assert [r['status'] for r in results] == \
+            ['success', 'success', 'error', 'error']
+
+        # A single bulk indexing operation
+        assert indexer.return_value.bulk_index.call_count == 1
+        assert set(indexer.return_value.bulk_index.call_args[0][0]) == \
+            set([str(records[0].id), str(records[1].id)])
+
+        response = client.post(
+            '/communities/comm1/curate/',
+            data=json.dumps({'records': [{'recid': '1', 'action': 'foo'}]}),
+            content_type='application/json')
+        assert response.status_code == 400
+
+    assert Record.get_record(records[0].id)[communities_key] == ['comm1']
+    assert InclusionRequest.query.count() == 0
+
+
+def test_index_after_commit(app, db):
+    """Test the deferred indexing of records."""
+    with patch('invenio_communities.indexer.RecordIndexer') as indexer:
+        # Rolled back changes are not indexed
+        index_after_commit(['a'])
+        db.session.rollback()
+        assert indexer.return_value.bulk_index.call_count == 0
+
+        # Ids are collected until the outermost transaction is committed
+        index_after_commit(['b', 'a'])
+        with db.session.begin_nested():
+            index_after_commit(['a', 'c'])
+        assert indexer.return_value.bulk_index.call_count == 0
+        db.session.commit()
+        indexer.return_value.bulk_index.assert_called_with(['a', 'b', 'c'])
+
+        # Released savepoints are dropped with the outermost transaction
+        with db.session.begin_nested():
+            index_after_commit(['e'])
+        db.session.rollback()
+        assert indexer.return_value.bulk_index.call_count == 1
+
+        # Synchronous indexing
+        app.config['COMMUNITIES_INDEXING_BULK'] = False
+        index_after_commit(['d'])
+        db.session.commit()
+        indexer.return_value.index_by_id.assert_called_with('d')
+        assert indexer.return_value.bulk_index.call_count == 1
+
+
+class MessageStandIn(object):
+    """Local stand-in of a queue message."""
+
+    def __init__(self, op, id):
+        """Initialize with the operation and the record id."""
+        self.payload = {'op': op, 'id': id}
+        self.acked = False
+
+    def decode(self):
+        """Decode the payload."""
+        return self.payload
+
+    def ack(self):
+        """Acknowledge the message."""
+        self.acked = True
+
+
+def test_communities_record_indexer_coalescing(app, db):
+    """Test coalescing the bulk indexing messages of a record."""
+    a, b = str(uuid4()), str(uuid4())
+    messages = [
+        MessageStandIn('index', a), MessageStandIn('index', b),
+        MessageStandIn('index', a), MessageStandIn('delete', b),
+    ]
+    indexer = CommunitiesRecordIndexer()
+    with patch.object(CommunitiesRecordIndexer, '_index_action',
+                      side_effect=lambda p: ('index', p['id'])), \
+            patch.object(CommunitiesRecordIndexer, '_delete_action',
+                         side_effect=lambda p: ('delete', p['id'])):
+        actions = list(indexer._actionsiter(messages))
+    assert actions == [('index', a), ('delete', b)]
+    assert [m.acked for m in messages] == [True, True, True, True]
+
+
+class SearchStandIn(object):
+    """Local stand-in of the search engine client."""
+
+    def __init__(self, docs):
+        """Initialize with documents as ``{id: (version, source)}``."""
+        self.docs = docs
+
+    def mget(self, body):
+        """Get many documents."""
+        return {'docs': [
+            {'_id': d['_id'], 'found': True,
+             '_source': dict(self.docs[d['_id']][1])}
+            if d['_id'] in self.docs else {'_id': d['_id'], 'found': False}
+            for d in body['docs']
+        ]}
+
+    def bulk(self, body):
+        """Index many documents with external versioning."""
+        items = []
+        for action, source in zip(body[::2], body[1::2]):
+            meta = action['index']
+            if meta['version'] < self.docs[meta['_id']][0]:
+                items.append({'index': {
+                    '_id': meta['_id'], 'status': 409, 'error': 'conflict'}})
+            else:
+                self.docs[meta['_id']] = (meta['version'], source)
+                items.append({'index': {'_id': meta['_id'], 'status': 200}})
+        return {'errors': any('error' in i['index'] for i in items),
+                'items': items}
+
+
+def test_update_records(app, db, communities, disable_request_email):
+    """Test the in place update of the community fields of records."""
+    (comm1, comm2, comm3) = communities
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazqux'})
+    rec3 = Record.create({'title': 'Quux'})
+    comm1.add_record(rec1)
+    rec1.commit()
+    InclusionRequest.create(community=comm2, record=rec1)
+    db.session.commit()
+
+    client = SearchStandIn({
+        str(rec1.id): (0, {'title': 'Foobar', 'communities': []}),
+        str(rec3.id): (100, {'title': 'Quux'}),
+    })
+    with patch('invenio_communities.indexer.RecordIndexer') as indexer:
+        indexer.return_value.record_to_index.return_value = (
+            'records-record-v1.0.0', 'record-v1.0.0')
+        missing = update_records([rec1.id, rec2.id, rec3.id], client=client)
+
+    # Missing documents need a full reindex, newer ones are kept
+    assert missing == {str(rec2.id)}
+    assert client.docs[str(rec3.id)] == (100, {'title': 'Quux'})
+    version, source = client.docs[str(rec1.id)]
+    assert version == rec1.revision_id
+    assert source['title'] == 'Foobar'
+    assert source['communities'] == ['comm1']
+    assert source['provisional_communities'] == ['comm2']
+    assert 'user-comm1' in source['_oai']['sets']
+
+    # Records whose document is missing are fully reindexed after commit
+    app.config['COMMUNITIES_INDEXING_PARTIAL'] = True
+    with patch('invenio_communities.tasks.update_records') as update, \
+            patch('invenio_communities.indexer.RecordIndexer') as indexer:
+        update.return_value = {'b'}
+        index_after_commit(['a', 'b'], partial=True)
+        index_after_commit(['c'])
+        db.session.commit()
+        update.assert_called_with(['a', 'b'])
+        assert sorted(
+            args[0] for args, kwargs in
+            indexer.return_value.bulk_index.call_args_list) == [['b'], ['c']]
+
+    # All the records are fully reindexed if the search engine fails
+    with patch('invenio_communities.tasks.update_records') as update, \
+            patch('invenio_communities.indexer.RecordIndexer') as indexer:
+        update.side_effect = Exception('Search engine unavailable.')
+        index_after_commit(['a', 'b'], partial=True)
+        db.session.commit()
+        indexer.return_value.bulk_index.assert_called_once_with(['a', 'b'])
+    app.config['COMMUNITIES_INDEXING_PARTIAL'] = False
+
+
+def test_prefetch_provisional_communities(app, db, communities,
+                                          disable_request_email):
+    """Test the injection of prefetched provisional communities."""
+    (comm1, comm2, comm3) = communities
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazqux'})
+    InclusionRequest.create(community=comm2, record=rec1)
+    InclusionRequest.create(community=comm1, record=rec1)
+    db.session.commit()
+
+    json = {}
+    inject_provisional_community(None, json=json, record=rec1)
+    assert json['provisional_communities'] == ['comm1', 'comm2']
+
+    with prefetch_provisional_communities([rec1.id, rec2.id]):
+        with patch.object(InclusionRequest, 'get_by_record') as get:
+            json1, json2 = {}, {}
+            inject_provisional_community(None, json=json1, record=rec1)
+            inject_provisional_community(None, json=json2, record=rec2)
+            assert not get.called
+    assert json1['provisional_communities'] == ['comm1', 'comm2']
+    assert json2['provisional_communities'] == []
+
+
+def test_bloom_filter():
+    """Test the Bloom filter."""
+    bloom = BloomFilter(1000, error_rate=0.01)
+    keys = [str(uuid4()) for _ in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(str(uuid4()) in bloom for _ in range(1000))
+    assert false_positives < 50
+
+
+def test_pending_requests_filter(app, db, communities,
+                                 disable_request_email):
+    """Test skipping the inclusion request lookup of records."""
+    (comm1, comm2, comm3) = communities
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazqux'})
+    InclusionRequest.create(community=comm1, record=rec1)
+    db.session.commit()
+
+    ext = app.extensions['invenio-communities']
+    app.config['COMMUNITIES_PENDING_REQUESTS_FILTER'] = True
+    ext.__dict__.pop('pending_requests', None)
+    # The filter needs a shared store
+    assert ext.pending_requests is None
+    ext.__dict__.pop('pending_requests')
+    app.config['COMMUNITIES_PENDING_REQUESTS_FILTER_STORE'] = InMemoryStore
+    pending = ext.pending_requests
+    assert rec1.id in pending
+
+    with patch.object(InclusionRequest, 'get_by_record') as get:
+        json = {}
+        inject_provisional_community(None, json=json, record=rec2)
+        assert json['provisional_communities'] == []
+        assert not get.called
+
+    # Requests created in this process are added to the filter
+    InclusionRequest.create(community=comm1, record=rec2)
+    db.session.commit()
+    json = {}
+    inject_provisional_community(None, json=json, record=rec2)
+    assert json['provisional_communities'] == ['comm1']
+
+    # Deleted requests remain in the filter until it is rebuilt
+    comm1.reject_record(rec2)
+    db.session.commit()
+    json = {}
+    inject_provisional_community(None, json=json, record=rec2)
+    assert json['provisional_communities'] == []
+    assert pending.false_positives == 1
+    assert pending.false_positive_rate == 0.5
+    pending.rebuild()
+    assert rec2.id not in pending
+
+    # Requests created by another process invalidate the filter
+    now = [0]
+    other = PendingRequestsFilter(store=pending.store,
+                                  timer=lambda: now[0])
+    assert rec2.id not in other
+    InclusionRequest.create(community=comm2, record=rec2)
+    db.session.rollback()
+    assert rec2.id not in other
+    InclusionRequest.create(community=comm2, record=rec2)
+    db.session.commit()
+    # The token read is reused during the check interval
+    with patch.object(pending.store, 'get') as get:
+        assert rec2.id not in other
+        assert not get.called
+    now[0] += 1
+    assert rec2.id in other
+    app.config['COMMUNITIES_PENDING_REQUESTS_FILTER'] = False
+    app.config['COMMUNITIES_PENDING_REQUESTS_FILTER_STORE'] = None
+    ext.__dict__.pop('pending_requests')
+
+
 def test_add_remove_corner_cases(app, db, communities, disable_request_email):
     """Test corner cases for community adding and removal."""
     (comm1, comm2, comm3) = communities
@@ -358,3 +963,104 @@ def test_add_remove_corner_cases(app, db, communities, disable_request_email):
     assert communities_key in rec1
     assert len(rec1[communities_key]) == 0
     assert not comm1.oaiset.has_record(rec1)
+
+
+def test_add_remove_records(app, db, communities):
+    """Test adding and removing many records at once."""
+    (comm1, comm2, comm3) = communities
+    communities_key = app.config["COMMUNITIES_RECORD_KEY"]
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazqux', communities_key: ['oth3']})
+
+    comm1.add_records([rec1, rec2])
+    comm2.add_records([rec2])
+    assert rec1[communities_key] == ['comm1']
+    assert rec2[communities_key] == ['comm1', 'comm2', 'oth3']
+    assert comm1.oaiset.has_record(rec1)
+    assert comm1.oaiset.has_record(rec2)
+
+    # Adding a record twice does not duplicate it
+    comm1.add_records([rec1])
+    assert rec1[communities_key] == ['comm1']
+
+    # Unsorted lists are sorted
+    rec3 = Record.create({'title': 'Legacy', communities_key: ['oth3', 'a']})
+    comm2.add_records([rec3])
+    assert rec3[communities_key] == ['a', 'comm2', 'oth3']
+
+    comm1.remove_records([rec1, rec2])
+    assert rec1[communities_key] == []
+    assert rec2[communities_key] == ['comm2', 'oth3']
+    assert not comm1.oaiset.has_record(rec1)
+    assert not comm1.oaiset.has_record(rec2)
+    assert comm2.oaiset.has_record(rec2)
+
+
+def test_community_members(app, db, communities, monkeypatch):
+    """Test the synchronization and rebuild of the membership table."""
+    (comm1, comm2, comm3) = communities
+    communities_key = app.config["COMMUNITIES_RECORD_KEY"]
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazqux'})
+
+    def members():
+        return set(db.session.query(
+            CommunityMember.id_community, CommunityMember.id_record))
+
+    comm1.add_records([rec1, rec2])
+    comm2.add_record(rec2)
+    comm1.add_records([rec1])
+    assert members() == set([
+        ('comm1', rec1.id), ('comm1', rec2.id), ('comm2', rec2.id)])
+    assert all(m.accepted_at for m in CommunityMember.query)
+
+    comm1.remove_record(rec2)
+    assert members() == set([('comm1', rec1.id), ('comm2', rec2.id)])
+    rec1.commit()
+    rec2.commit()
+    db.session.commit()
+
+    # Drift between the records and the table is repaired by a rebuild
+    rec2[communities_key] = ['comm2', 'comm3', 'unknown']
+    rec2.commit()
+    CommunityMember.remove('comm1', [rec1.id])
+    db.session.commit()
+    assert CommunityMember.rebuild(chunk_size=1) == (2, 0)
+    assert members() == set([
+        ('comm1', rec1.id), ('comm2', rec2.id), ('comm3', rec2.id)])
+
+    rec1[communities_key] = []
+    rec1.commit()
+    db.session.commit()
+    assert CommunityMember.rebuild() == (0, 1)
+    assert members() == set([('comm2', rec2.id), ('comm3', rec2.id)])
+
+    # Large batches are split in several statements
+    monkeypatch.setattr(CommunityMember, 'chunk_size', 2)
+    record_ids = [rec1.id, rec2.id] + [
+        Record.create({}, id_=uuid4()).id for _ in range(3)]
+    CommunityMember.add('comm2', record_ids)
+    assert set(r for c, r in members() if c == 'comm2') == set(record_ids)
+    CommunityMember.remove('comm2', record_ids[1:])
+    assert set(r for c, r in members() if c == 'comm2') == set([rec1.id])
+
+
+def test_record_ids_query(app, db, communities):
+    """Test querying the records of a community in the database."""
+    (comm1, comm2, comm3) = communities
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazqux'})
+    comm1.add_records([rec1, rec2])
+    comm2.add_record(rec2)
+    rec1.commit()
+    rec2.commit()
+    db.session.commit()
+
+    assert set(i for i, in comm1.record_ids_query()) == set([rec1.id, rec2.id])
+    assert set(i for i, in comm2.record_ids_query()) == set([rec2.id])
+    assert comm3.record_ids_query().count() == 0
+
+    expression = Community.records_filter(['comm1', 'comm2']).compile(
+        dialect=postgresql.dialect())
+    assert '@>' in str(expression)
+    assert ['comm1', 'comm2'] in expression.params.values()
@@ -26,9 +26,13 @@
 
 from __future__ import absolute_import, print_function
 
+from datetime import datetime
+
 import pytest
 
 from invenio_communities.models import Community
+from invenio_communities.search import PostgreSQLSearchBackend, \
+    SQLiteSearchBackend
 
 
 @pytest.mark.parametrize('case_modifier', [
@@ -75,3 +79,108 @@ def test_filter_community(app, db, communities_for_filtering, user,
                 so='title').all()
     assert len(results) == 0
     assert {c.id for c in results} == set()
+
+
+def test_filter_community_full_text(app, db, communities_for_filtering):
+    """Test filtering communities with the full-text search backends."""
+    (comm0, comm1, comm2) = communities_for_filtering
+    backends = {
+        'postgresql': PostgreSQLSearchBackend,
+        'sqlite': SQLiteSearchBackend,
+    }
+    if db.engine.name not in backends:
+        raise pytest.skip('No full-text backend for {0}.'.format(
+            db.engine.name))
+    app.config['COMMUNITIES_SEARCH_BACKEND'] = backends[db.engine.name]
+    db.session.commit()
+
+    # Prefix matching on words
+    results = Community.filter_communities(p='test', so=None).all()
+    assert {c.id for c in results} == {comm0.id, comm1.id, comm2.id}
+
+    # Words match in any order
+    results = Community.filter_communities(
+        p='implicit explicit', so=None).all()
+    assert [c.id for c in results] == [comm0.id]
+
+    # The index follows updates
+    comm2.description = 'Explicitly implicit.'
+    db.session.commit()
+    results = Community.filter_communities(
+        p='implicit explicit', so='title').all()
+    assert [c.id for c in results] == [comm2.id, comm0.id]
+
+    # The index follows deletions
+    db.session.delete(comm1)
+    db.session.commit()
+    results = Community.filter_communities(p='sparse', so=None).all()
+    assert results == []
+
+
+def test_community_cache(app, db, communities):
+    """Test the read-through cache of Community.get."""
+    (comm0, comm1, comm2) = communities
+    db.session.commit()
+    cache = app.extensions['invenio-communities'].community_cache
+    cache.clear()
+    hits, misses = cache.hits, cache.misses
+    community_id = comm0.id
+
+    assert Community.get(community_id, cached=True) is comm0
+    assert (cache.hits, cache.misses) == (hits, misses + 1)
+
+    # A new session is served from the cache
+    db.session.expunge_all()
+    comm = Community.get(community_id, cached=True)
+    assert comm.title == 'Title1'
+    assert (cache.hits, cache.misses) == (hits + 1, misses + 1)
+
+    # Updates invalidate the entry
+    comm.title = 'New title'
+    db.session.commit()
+    assert community_id not in cache._entries
+    db.session.expunge_all()
+    assert Community.get(community_id, cached=True).title == 'New title'
+    assert cache.misses == misses + 2
+
+    # Deleted communities are cached but filtered
+    Community.get(community_id).delete()
+    db.session.commit()
+    assert Community.get(community_id, cached=True) is None
+    assert Community.get(
+        community_id, with_deleted=True, cached=True).is_deleted
+    assert (cache.hits, cache.misses) == (hits + 2, misses + 3)
+
+
+def test_community_cache_stale_version(app, db, communities):
+    """Test updating a cached community changed by another process."""
+    (comm0, comm1, comm2) = communities
+    db.session.commit()
+    cache = app.extensions['invenio-communities'].community_cache
+    cache.clear()
+    community_id = comm0.id
+    Community.get(community_id, cached=True)
+
+    # Another process updates the row, the cache entry is not invalidated
+    table = Community.__table__
+    db.session.execute(table.update().where(
+        table.c.id == community_id).values(
+            version_id=table.c.version_id + 1))
+    db.session.commit()
+    db.session.expunge_all()
+    comm = Community.get(community_id, cached=True)
+    assert comm.version_id == 1
+
+    # Communities are read from the database by default
+    comm = Community.get(community_id)
+    assert comm.version_id == 2
+    comm.last_record_accepted = datetime.utcnow()
+    db.session.commit()
+    assert comm.version_id == 3
+
+    # Pending changes are not overwritten
+    comm.title = 'New title'
+    assert Community.get(community_id).title == 'New title'
+    db.session.commit()
+    db.session.expunge_all()
+    assert Community.get(community_id).title == 'New title'
@@ -26,9 +26,17 @@
 
 from __future__ import absolute_import, print_function
 
+from datetime import datetime, timedelta
+
+from invenio_oaiserver.models import OAISet
 from invenio_records.api import Record
+from mock import patch
 
-from invenio_communities.models import InclusionRequest
+from invenio_communities.models import Community, FeaturedCommunity, \
+    InclusionRequest
+from invenio_communities.ranking import rank_communities
+from invenio_communities.tasks import delete_expired_requests, \
+    delete_marked_communities, update_ranking
 
 
 def test_community_delete_task(app, db, communities):
@@ -45,3 +53,124 @@ def test_community_delete_task(app, db, communities):
 
     comm1.delete()
     assert comm1.is_deleted
+
+
+def test_delete_marked_communities_task(app, db, communities,
+                                        disable_request_email):
+    """Test the purge of the communities marked for deletion."""
+    (comm1, comm2, comm3) = communities
+    communities_key = app.config["COMMUNITIES_RECORD_KEY"]
+    records = [Record.create({'title': str(i)}) for i in range(3)]
+    comm1.add_records(records[:2])
+    comm2.add_records(records[1:2])
+    for record in records[:2]:
+        record.commit()
+    InclusionRequest.create(community=comm1, record=records[2])
+    db.session.add(FeaturedCommunity(id_community=comm1.id))
+    comm1.delete()
+    comm1.deleted_at = datetime.utcnow() - timedelta(days=400)
+    comm2.delete()
+    db.session.commit()
+    app.config['COMMUNITIES_DELETE_RECORD_IDS'] = \
+        lambda community_id: [str(r.id) for r in records[:2]]
+
+    with patch('invenio_communities.indexer.RecordIndexer'):
+        delete_marked_communities.delay(chunk_size=1)
+
+    assert Community.get('comm1', with_deleted=True) is None
+    assert Community.get('comm2', with_deleted=True) is not None
+    assert InclusionRequest.query.count() == 0
+    assert FeaturedCommunity.query.count() == 0
+    assert OAISet.query.filter_by(spec='user-comm1').count() == 0
+    records = [Record.get_record(r.id) for r in records[:2]]
+    assert [r[communities_key] for r in records] == [[], ['comm2']]
+    assert all('user-comm1' not in r.get('_oai', {}).get('sets', [])
+               for r in records)
+
+
+def test_delete_marked_communities_stale_index(app, db, communities):
+    """Test the purge of a community missing records in the search index."""
+    (comm1, comm2, comm3) = communities
+    communities_key = app.config["COMMUNITIES_RECORD_KEY"]
+    records = [Record.create({'title': str(i)}) for i in range(2)]
+    comm1.add_records(records)
+    for record in records:
+        record.commit()
+    comm1.delete()
+    comm1.deleted_at = datetime.utcnow() - timedelta(days=400)
+    db.session.commit()
+    app.config['COMMUNITIES_DELETE_RECORD_IDS'] = \
+        lambda community_id: [str(records[0].id)]
+
+    with patch('invenio_communities.indexer.RecordIndexer'):
+        delete_marked_communities.delay(chunk_size=1)
+
+    assert Community.get('comm1', with_deleted=True) is None
+    assert [Record.get_record(r.id)[communities_key] for r in records] == \
+        [[], []]
+
+
+def test_delete_expired_requests_task(app, db, communities):
+    """Test the expired inclusion requests deletion task."""
+    (comm1, comm2, comm3) = communities
+    rec1 = Record.create({'title': 'Foobar'})
+    rec2 = Record.create({'title': 'Bazqux'})
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    for comm, rec in ((comm1, rec1), (comm2, rec1), (comm1, rec2),
+                      (comm3, rec2)):
+        InclusionRequest.create(community=comm, record=rec,
+                                expires_at=expires_at, notify=False)
+    InclusionRequest.get(comm3.id, rec2.id).expires_at = None
+    for comm, rec in ((comm1, rec1), (comm2, rec1), (comm1, rec2)):
+        InclusionRequest.get(comm.id, rec.id).expires_at = \
+            datetime.utcnow() - timedelta(days=1)
+    db.session.commit()
+
+    with patch('invenio_communities.indexer.RecordIndexer') as indexer:
+        delete_expired_requests.delay(chunk_size=2)
+        assert indexer.return_value.bulk_index.call_count == 2
+        indexed = set()
+        for args, kwargs in indexer.return_value.bulk_index.call_args_list:
+            indexed.update(args[0])
+        assert indexed == {str(rec1.id), str(rec2.id)}
+
+    assert [(r.id_community, r.id_record) for r in
+            InclusionRequest.query.all()] == [(comm3.id, rec2.id)]
+
+
+def test_update_ranking_task(app, db, communities):
+    """Test the community ranking task."""
+    (comm1, comm2, comm3) = communities
+    comm2.last_record_accepted = datetime.utcnow() - timedelta(days=10)
+    comm3.fixed_points = 100
+    db.session.commit()
+    app.config['COMMUNITIES_RANKING_RECORD_COUNTS'] = \
+        lambda: {'comm1': 5, 'comm2': 2}
+
+    update_ranking.delay()
+
+    assert Community.get('comm1').ranking == 5
+    assert Community.get('comm2').ranking == 2 + 20
+    assert Community.get('oth3').ranking == 100
+    assert [c.id for c in Community.filter_communities(None, 'ranking')] == \
+        ['oth3', 'comm2', 'comm1']
+
+
+def test_rank_communities_chunks(app, db, communities):
+    """Test writing the rankings in several chunks."""
+    (comm1, comm2, comm3) = communities
+    comm3.fixed_points = 100
+    db.session.commit()
+    app.config['COMMUNITIES_RANKING_RECORD_COUNTS'] = \
+        lambda: {'comm1': 5, 'comm2': 2}
+    version, updated = db.session.query(
+        Community.version_id, Community.updated).filter_by(id='comm1').one()
+
+    assert rank_communities(chunk_size=2) == 3
+    db.session.commit()
+    assert rank_communities(chunk_size=2) == 0
+    assert dict(db.session.query(Community.id, Community.ranking)) == {
+        'comm1': 5, 'comm2': 2, 'oth3': 100}
+    assert db.session.query(
+        Community.version_id, Community.updated).filter_by(
+            id='comm1').one() == (version + 1, updated)